@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+from .bench import main
+
+main()
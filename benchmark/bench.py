@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import argparse
+import io
+import os
+import sys
+import json
+import shutil
+import platform
+import tempfile
+from datetime import datetime
+
+import colorama
+from colorama import Fore
+
+from bittytax.version import __version__
+from bittytax.config import config
+from bittytax.audit import AuditRecords
+from bittytax.transactions import TransactionHistory
+from bittytax.tax import TaxCalculator
+from bittytax.report import ReportLog, ReportPdf
+from bittytax.profiler import profiler
+from bittytax import bittytax
+
+from .ledger import LedgerGenerator
+from .prices import StubValueAsset
+
+def main():
+    colorama.init()
+    parser = argparse.ArgumentParser(
+        description="time each stage of bittytax for synthetic ledgers of different sizes")
+    parser.add_argument('-r',
+                        '--records',
+                        type=int,
+                        nargs='+',
+                        default=[10000, 100000],
+                        help="number of transaction records in each ledger, "
+                             "default: 10000 100000")
+    parser.add_argument('--assets',
+                        type=int,
+                        default=10,
+                        help="number of cryptoassets, default: 10")
+    parser.add_argument('--years',
+                        type=int,
+                        default=5,
+                        help="number of years the records are spread over, default: 5")
+    parser.add_argument('--crypto-trades',
+                        dest='crypto_trades',
+                        type=float,
+                        default=0.2,
+                        help="ratio of disposals which are crypto-to-crypto trades, default: 0.2")
+    parser.add_argument('--transfers',
+                        type=float,
+                        default=0.05,
+                        help="ratio of records which start a transfer, default: 0.05")
+    parser.add_argument('--same-day',
+                        dest='same_day',
+                        type=float,
+                        default=0.1,
+                        help="ratio of disposals bought back the same day, default: 0.1")
+    parser.add_argument('--bnb',
+                        type=float,
+                        default=0.05,
+                        help="ratio of disposals bought back within 30 days, default: 0.05")
+    parser.add_argument('--income',
+                        type=float,
+                        default=0.05,
+                        help="ratio of records which are income, default: 0.05")
+    parser.add_argument('--fees',
+                        type=float,
+                        default=0.3,
+                        help="ratio of records which have a fee, default: 0.3")
+    parser.add_argument('--fee-assets',
+                        dest='fee_assets',
+                        type=str,
+                        nargs='+',
+                        default=['GBP', 'BNB'],
+                        help="assets used to pay fees, default: GBP BNB")
+    parser.add_argument('--seed',
+                        type=int,
+                        default=1,
+                        help="random seed used to generate the ledgers, default: 1")
+    parser.add_argument('--taxrules',
+                        choices=[config.TAX_RULES_UK_INDIVIDUAL] + config.TAX_RULES_UK_COMPANY,
+                        default=config.TAX_RULES_UK_INDIVIDUAL,
+                        type=str.upper,
+                        dest='tax_rules',
+                        help="specify tax rules to use, default: UK_INDIVIDUAL")
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=1,
+                        help="number of processes used to calculate disposals, default: 1")
+    parser.add_argument('--pdf',
+                        action='store_true',
+                        help="time the PDF report, instead of the report to the terminal")
+    parser.add_argument('--memory',
+                        action='store_true',
+                        help="trace peak memory for each stage, this slows down processing")
+    parser.add_argument('--stats',
+                        metavar='DIRECTORY',
+                        type=str,
+                        help="write a cProfile stats file for each stage to a directory")
+    parser.add_argument('--ledgers',
+                        metavar='DIRECTORY',
+                        type=str,
+                        help="keep the generated ledgers in a directory")
+    parser.add_argument('--compare',
+                        metavar='FILENAME',
+                        type=str,
+                        help="compare with the results from a previous benchmark")
+    parser.add_argument('-o',
+                        dest='output_filename',
+                        type=str,
+                        help="write the results to a JSON file")
+
+    args = parser.parse_args()
+
+    if args.tax_rules in config.TAX_RULES_UK_COMPANY:
+        config.start_of_year_month = config.TAX_RULES_UK_COMPANY.index(args.tax_rules) + 1
+        config.start_of_year_day = 1
+
+    ledger_dir = args.ledgers or tempfile.mkdtemp(prefix='bittytax_benchmark_')
+    if not os.path.exists(ledger_dir):
+        os.makedirs(ledger_dir)
+
+    results = {'version': __version__,
+               'python': platform.python_version(),
+               'system': platform.system(),
+               'machine': platform.machine(),
+               'date': datetime.now().isoformat(),
+               'tax_rules': args.tax_rules,
+               'jobs': args.jobs,
+               'runs': []}
+
+    try:
+        for records in args.records:
+            generator = LedgerGenerator(records=records,
+                                        assets=args.assets,
+                                        years=args.years,
+                                        crypto_trades=args.crypto_trades,
+                                        transfers=args.transfers,
+                                        same_day=args.same_day,
+                                        bed_and_breakfast=args.bnb,
+                                        income=args.income,
+                                        fees=args.fees,
+                                        fee_assets=args.fee_assets,
+                                        seed=args.seed)
+            results['runs'].append(run(generator, ledger_dir, args))
+    finally:
+        if not args.ledgers:
+            shutil.rmtree(ledger_dir)
+
+    if args.compare:
+        with open(args.compare, 'r') as json_file:
+            compare(json.load(json_file), results)
+
+    if args.output_filename:
+        with open(args.output_filename, 'w') as json_file:
+            json.dump(results, json_file, indent=4)
+
+def run(generator, ledger_dir, args):
+    filename = os.path.join(ledger_dir, 'ledger_%d.csv' % generator.records)
+    if sys.version_info[0] < 3:
+        with open(filename, 'wb') as csv_file:
+            generator.write_csv(csv_file)
+    else:
+        with io.open(filename, 'w', newline='', encoding='utf-8') as csv_file:
+            generator.write_csv(csv_file)
+
+    print("%sbenchmark: %s records" % (Fore.CYAN, '{:0,d}'.format(generator.records)))
+
+    profiler.reset()
+    profiler.enable(args.stats and os.path.join(args.stats, str(generator.records)),
+                    args.memory)
+
+    try:
+        with profiler.stage('import') as stage:
+            transaction_records = bittytax.do_import(filename)
+            stage.count = len(transaction_records)
+
+        # Same stages as the accounting tool, but valued with the stub prices
+        audit = AuditRecords()
+        value_asset = StubValueAsset()
+
+        with profiler.stage('split', len(transaction_records)):
+            transaction_history = TransactionHistory(transaction_records, value_asset, audit)
+
+        tax = TaxCalculator(transaction_history.transactions, args.tax_rules,
+                            transaction_history.income_transactions)
+
+        if args.jobs > 1:
+            with profiler.stage('process disposals', len(tax.transactions)):
+                tax.process_disposals_by_asset(args.jobs, False)
+        else:
+            tax.process_disposals(False)
+
+        with profiler.stage('integrity check', len(tax.holdings)):
+            audit.compare_pools(tax.holdings)
+
+        with profiler.stage('process income'):
+            tax.process_income()
+
+        bittytax.do_each_tax_year(tax, None, False, value_asset)
+
+        with profiler.stage('report'):
+            report_args = argparse.Namespace(taxyear=None,
+                                             summary=False,
+                                             tax_rules=args.tax_rules,
+                                             output_filename=os.path.join(ledger_dir,
+                                                                          'report.pdf'))
+            if args.pdf:
+                ReportPdf('benchmark', audit, tax.tax_report, value_asset.price_report,
+                          tax.holdings_report, report_args)
+            else:
+                # Only the time taken matters, not the report
+                stdout = sys.stdout
+                sys.stdout = open(os.devnull, 'w')
+                try:
+                    ReportLog(audit, tax.tax_report, value_asset.price_report,
+                              tax.holdings_report, report_args)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+    finally:
+        profiler.disable()
+
+    profiler.output()
+    profiler.write_stats()
+
+    stages = profiler.results()
+    return {'records': generator.records,
+            'ledger': generator.settings(),
+            'wall_time': sum(stage['wall_time'] for stage in stages),
+            'cpu_time': sum(stage['cpu_time'] for stage in stages),
+            'stages': stages}
+
+def compare(previous, results):
+    print("%sbenchmark: compared with v%s (%s)" % (
+        Fore.CYAN, previous['version'], previous['date']))
+
+    header = "%-10s %-32s %12s %12s %9s" % ('Records', 'Stage', 'Previous', 'Wall Time',
+                                            'Change')
+    print("%s%s" % (Fore.YELLOW, header))
+
+    previous_runs = {run['records']: run for run in previous['runs']}
+    for run in results['runs']:
+        if run['records'] not in previous_runs:
+            continue
+
+        previous_stages = {stage['name']: stage for stage in
+                           previous_runs[run['records']]['stages']}
+        for stage in run['stages'] + [dict(name='total', wall_time=run['wall_time'])]:
+            if stage['name'] == 'total':
+                previous_time = previous_runs[run['records']]['wall_time']
+            elif stage['name'] in previous_stages:
+                previous_time = previous_stages[stage['name']]['wall_time']
+            else:
+                continue
+
+            if previous_time:
+                change = (stage['wall_time'] - previous_time) / previous_time * 100
+            else:
+                change = 0
+
+            print("%s%-10s %-32s %11.3fs %11.3fs %s%+8.1f%%" % (
+                Fore.WHITE,
+                '{:0,d}'.format(run['records']),
+                stage['name'],
+                previous_time,
+                stage['wall_time'],
+                Fore.RED if change > 0 else Fore.GREEN,
+                change))
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import csv
+import random
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+from bittytax.record import TransactionRecord as TR
+from bittytax.import_records import TransactionRow
+
+class LedgerGenerator(object):
+    # Synthetic transaction records in the BittyTax format, the same settings and seed always
+    #  give the same ledger. Trade frequency follows from the number of records and years
+    INCOME_TYPES = (TR.TYPE_MINING, TR.TYPE_STAKING, TR.TYPE_INTEREST)
+    WALLETS = ('Exchange', 'Hardware', 'Mobile')
+
+    def __init__(self, records=10000, assets=10, years=5, start_year=2015, crypto_trades=0.2,
+                 transfers=0.05, same_day=0.1, bed_and_breakfast=0.05, income=0.05,
+                 fees=0.3, fee_assets=('GBP', 'BNB'), seed=1):
+        self.records = records
+        self.assets = ['BTC', 'ETH'] + ['TOKEN%d' % i for i in range(max(assets - 2, 0))]
+        self.assets = self.assets[:assets]
+        self.fee_assets = list(fee_assets)
+        self.start = datetime(start_year, 1, 1)
+        self.seconds = int(timedelta(days=365 * years).total_seconds())
+        self.crypto_trades = crypto_trades
+        self.transfers = transfers
+        self.same_day = same_day
+        self.bed_and_breakfast = bed_and_breakfast
+        self.income = income
+        self.fees = fees
+        self.seed = seed
+
+    def settings(self):
+        return {'records': self.records,
+                'assets': len(self.assets),
+                'years': self.seconds // int(timedelta(days=365).total_seconds()),
+                'start_year': self.start.year,
+                'crypto_trades': self.crypto_trades,
+                'transfers': self.transfers,
+                'same_day': self.same_day,
+                'bed_and_breakfast': self.bed_and_breakfast,
+                'income': self.income,
+                'fees': self.fees,
+                'fee_assets': self.fee_assets,
+                'seed': self.seed}
+
+    def rows(self):
+        rnd = random.Random(self.seed)
+        balances = {asset: Decimal(0) for asset in self.assets + self.fee_assets}
+        step = float(self.seconds) / max(self.records, 1)
+        count = 0
+
+        # Start with a holding of each fee asset, so fees can be paid
+        for asset in self.fee_assets:
+            if asset in balances and asset != 'GBP':
+                yield self._row(TR.TYPE_TRADE, Decimal(1000), asset, Decimal(1000),
+                                Decimal(1000), 'GBP', None, None, self.WALLETS[0], self.start)
+                balances[asset] += Decimal(1000)
+                count += 1
+
+        while count < self.records:
+            timestamp = self.start + timedelta(seconds=int(count * step + rnd.random() * step))
+            asset = rnd.choice(self.assets)
+            wallet = self.WALLETS[0]
+            fee = self._fee(rnd, balances)
+            kind = rnd.random()
+
+            if kind < self.income:
+                quantity = self._quantity(rnd)
+                yield self._row(rnd.choice(self.INCOME_TYPES), quantity, asset, None,
+                                None, None, None, fee, wallet, timestamp)
+                balances[asset] += quantity
+                count += 1
+            elif kind < self.income + self.transfers and balances[asset] > 0:
+                quantity = (balances[asset] * Decimal(rnd.randint(1, 50)) / 100).quantize(
+                    Decimal('0.00000001'))
+                to_wallet = rnd.choice(self.WALLETS[1:])
+                yield self._row(TR.TYPE_WITHDRAWAL, None, None, None, quantity, asset, None,
+                                fee, wallet, timestamp)
+                yield self._row(TR.TYPE_DEPOSIT, quantity, asset, None, None, None, None,
+                                None, to_wallet, timestamp + timedelta(minutes=10))
+                yield self._row(TR.TYPE_WITHDRAWAL, None, None, None, quantity, asset, None,
+                                None, to_wallet, timestamp + timedelta(minutes=20))
+                yield self._row(TR.TYPE_DEPOSIT, quantity, asset, None, None, None, None,
+                                None, wallet, timestamp + timedelta(minutes=30))
+                count += 4
+            elif balances[asset] <= 0 or rnd.random() < 0.5:
+                quantity = self._quantity(rnd)
+                value = self._value(rnd)
+                yield self._row(TR.TYPE_TRADE, quantity, asset, None, value, 'GBP', None,
+                                fee, wallet, timestamp)
+                balances[asset] += quantity
+                count += 1
+            elif len(self.assets) > 1 and rnd.random() < self.crypto_trades:
+                # Valued using the price data
+                quantity = (balances[asset] * Decimal(rnd.randint(1, 60)) / 100).quantize(
+                    Decimal('0.00000001'))
+                buy_asset = rnd.choice([a for a in self.assets if a != asset])
+                buy_quantity = self._quantity(rnd)
+                yield self._row(TR.TYPE_TRADE, buy_quantity, buy_asset, None, quantity, asset,
+                                None, fee, wallet, timestamp)
+                balances[asset] -= quantity
+                balances[buy_asset] += buy_quantity
+                count += 1
+            else:
+                quantity = (balances[asset] * Decimal(rnd.randint(1, 60)) / 100).quantize(
+                    Decimal('0.00000001'))
+                value = self._value(rnd)
+                yield self._row(TR.TYPE_TRADE, value, 'GBP', None, quantity, asset, None,
+                                fee, wallet, timestamp)
+                balances[asset] -= quantity
+                count += 1
+
+                if rnd.random() < self.same_day:
+                    # Bought back the same day
+                    yield self._row(TR.TYPE_TRADE, quantity / 2, asset, None, value / 2, 'GBP',
+                                    None, None, wallet, timestamp + timedelta(minutes=5))
+                    balances[asset] += quantity / 2
+                    count += 1
+                elif rnd.random() < self.bed_and_breakfast:
+                    # Bought back within 30 days, records can be in any order. Not added to
+                    #  the balance, as it could be sold before it's bought
+                    yield self._row(TR.TYPE_TRADE, quantity / 2, asset, None, value / 2, 'GBP',
+                                    None, None, wallet,
+                                    timestamp + timedelta(days=rnd.randint(1, 30)))
+                    count += 1
+
+    def _fee(self, rnd, balances):
+        if not self.fee_assets or rnd.random() >= self.fees:
+            return None
+
+        asset = rnd.choice(self.fee_assets)
+        quantity = Decimal(rnd.randint(1, 100)) / 1000
+        if asset != 'GBP':
+            if balances.get(asset, 0) < quantity:
+                return None
+            balances[asset] -= quantity
+
+        return quantity, asset
+
+    @staticmethod
+    def _quantity(rnd):
+        return Decimal(rnd.randint(1, 10 ** 6)) / 10 ** 4
+
+    @staticmethod
+    def _value(rnd):
+        return Decimal(rnd.randint(1, 10 ** 7)) / 100
+
+    @staticmethod
+    def _row(t_type, buy_quantity, buy_asset, buy_value, sell_quantity, sell_asset,
+             sell_value, fee, wallet, timestamp):
+        fee_quantity, fee_asset = fee if fee else (None, None)
+        return [t_type,
+                '' if buy_quantity is None else str(buy_quantity),
+                buy_asset or '',
+                '' if buy_value is None else str(buy_value),
+                '' if sell_quantity is None else str(sell_quantity),
+                sell_asset or '',
+                '' if sell_value is None else str(sell_value),
+                '' if fee_quantity is None else str(fee_quantity),
+                fee_asset or '',
+                '',
+                wallet,
+                timestamp.strftime('%Y-%m-%dT%H:%M:%S') + ' UTC',
+                '']
+
+    def write_csv(self, csv_file):
+        writer = csv.writer(csv_file, lineterminator='\n')
+        writer.writerow(TransactionRow.HEADER)
+        for row in self.rows():
+            writer.writerow(row)
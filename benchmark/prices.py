@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+from decimal import Decimal
+
+from bittytax.price.valueasset import ValueAsset
+
+class StubPriceData(object):
+    # Prices made up from the asset and the day, so no data source is used
+    NAME = 'Benchmark'
+    BTC_PRICE = Decimal(30000)
+
+    def get_historical(self, asset, quote, timestamp, no_cache=False):
+        return self.price(asset, quote, timestamp.toordinal()), asset, self.NAME, None
+
+    def get_latest(self, asset, quote):
+        return self.price(asset, quote, 0), asset, self.NAME
+
+    def price(self, asset, quote, day):
+        price = Decimal(sum(ord(c) for c in asset) % 1000 + 1) * (100 + day % 50) / 100
+        if quote == 'BTC':
+            return price / self.BTC_PRICE
+        return price
+
+class StubValueAsset(ValueAsset):
+    # The real valuation code, using the stub price data
+    def __init__(self):
+        self.price_tool = False
+        self.price_report = {}
+        self.price_data = StubPriceData()
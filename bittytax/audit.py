@@ -1,58 +1,67 @@
 # -*- coding: utf-8 -*-
 # (c) Nano Nano Ltd 2019
 
-import sys
 from decimal import Decimal
 
 from colorama import Fore, Back, Style
 from tqdm import tqdm
 
 from .config import config
+from .progress import progress
+from .log import get_log
+
+log = get_log('audit')
 
 class AuditRecords(object):
-    def __init__(self, transaction_records):
+    def __init__(self, transaction_records=None):
         self.wallets = {}
         self.totals = {}
         self.failures = []
 
-        if config.debug:
-            print("%saudit transaction records" % Fore.CYAN)
+        if transaction_records is None:
+            # Records are audited as they are split instead, see TransactionHistory
+            return
+
+        log.debug(Fore.CYAN, "audit transaction records")
+
+        for tr in progress(transaction_records, "audit transaction records", unit='tr'):
+            self.audit_record(tr)
+
+        self.output_balances()
 
-        for tr in tqdm(transaction_records,
-                       unit='tr',
-                       desc="%saudit transaction records%s" % (Fore.CYAN, Fore.GREEN),
-                       disable=bool(config.debug or not sys.stdout.isatty())):
-            if config.debug:
-                print("%saudit: TR %s" % (Fore.MAGENTA, tr))
-            if tr.buy:
-                self._add_tokens(tr.wallet, tr.buy.asset, tr.buy.quantity)
+    def audit_record(self, tr):
+        if log.is_debug():
+            log.debug(Fore.MAGENTA, "audit: TR %s", tr, asset=tr.assets())
+        if tr.buy:
+            self._add_tokens(tr.wallet, tr.buy.asset, tr.buy.quantity)
 
-            if tr.sell:
-                self._subtract_tokens(tr.wallet, tr.sell.asset, tr.sell.quantity)
+        if tr.sell:
+            self._subtract_tokens(tr.wallet, tr.sell.asset, tr.sell.quantity)
 
-            if tr.fee:
-                self._subtract_tokens(tr.wallet, tr.fee.asset, tr.fee.quantity)
+        if tr.fee:
+            self._subtract_tokens(tr.wallet, tr.fee.asset, tr.fee.quantity)
 
-        if config.debug:
-            print("%saudit: final balances by wallet" % Fore.CYAN)
+    def output_balances(self):
+        if log.is_debug():
+            log.debug(Fore.CYAN, "audit: final balances by wallet")
             for wallet in sorted(self.wallets, key=str.lower):
                 for asset in sorted(self.wallets[wallet]):
-                    print("%saudit: %s:%s=%s%s%s" % (
-                        Fore.YELLOW,
-                        wallet,
-                        asset,
-                        Style.BRIGHT,
-                        '{:0,f}'.format(self.wallets[wallet][asset].normalize()),
-                        Style.NORMAL))
-
-            print("%saudit: final balances by asset" % Fore.CYAN)
+                    log.debug(Fore.YELLOW, "audit: %s:%s=%s%s%s",
+                              wallet,
+                              asset,
+                              Style.BRIGHT,
+                              '{:0,f}'.format(self.wallets[wallet][asset].normalize()),
+                              Style.NORMAL,
+                              asset=asset)
+
+            log.debug(Fore.CYAN, "audit: final balances by asset")
             for asset in sorted(self.totals):
-                print("%saudit: %s=%s%s%s" % (
-                    Fore.YELLOW,
-                    asset,
-                    Style.BRIGHT,
-                    '{:0,f}'.format(self.totals[asset].normalize()),
-                    Style.NORMAL))
+                log.debug(Fore.YELLOW, "audit: %s=%s%s%s",
+                          asset,
+                          Style.BRIGHT,
+                          '{:0,f}'.format(self.totals[asset].normalize()),
+                          Style.NORMAL,
+                          asset=asset)
 
     def _add_tokens(self, wallet, asset, quantity):
         if wallet not in self.wallets:
@@ -68,13 +77,13 @@ class AuditRecords(object):
 
         self.totals[asset] += quantity
 
-        if config.debug:
-            print("%saudit:   %s:%s=%s (+%s)" % (
-                Fore.GREEN,
-                wallet,
-                asset,
-                '{:0,f}'.format(self.wallets[wallet][asset].normalize()),
-                '{:0,f}'.format(quantity.normalize())))
+        if log.is_debug(asset):
+            log.debug(Fore.GREEN, "audit:   %s:%s=%s (+%s)",
+                      wallet,
+                      asset,
+                      '{:0,f}'.format(self.wallets[wallet][asset].normalize()),
+                      '{:0,f}'.format(quantity.normalize()),
+                      asset=asset)
 
     def _subtract_tokens(self, wallet, asset, quantity):
         if wallet not in self.wallets:
@@ -90,13 +99,13 @@ class AuditRecords(object):
 
         self.totals[asset] -= quantity
 
-        if config.debug:
-            print("%saudit:   %s:%s=%s (-%s)" %(
-                Fore.GREEN,
-                wallet,
-                asset,
-                '{:0,f}'.format(self.wallets[wallet][asset].normalize()),
-                '{:0,f}'.format(quantity.normalize())))
+        if log.is_debug(asset):
+            log.debug(Fore.GREEN, "audit:   %s:%s=%s (-%s)",
+                      wallet,
+                      asset,
+                      '{:0,f}'.format(self.wallets[wallet][asset].normalize()),
+                      '{:0,f}'.format(quantity.normalize()),
+                      asset=asset)
 
         if self.wallets[wallet][asset] < 0 and asset not in config.fiat_list:
             tqdm.write("%sWARNING%s Balance at %s:%s is negative %s" % (
@@ -111,19 +120,18 @@ class AuditRecords(object):
 
             if asset in holdings:
                 if self.totals[asset] == holdings[asset].quantity:
-                    if config.debug:
-                        print("%scheck pool: %s (ok)" %(Fore.GREEN, asset))
+                    log.debug(Fore.GREEN, "check pool: %s (ok)", asset, asset=asset)
                 else:
-                    if config.debug:
-                        print("%scheck pool: %s %s (mismatch)" %(Fore.RED, asset,
-                            '{:+0,f}'.format((holdings[asset].quantity-
-                                              self.totals[asset]).normalize())))
+                    if log.is_debug(asset):
+                        log.debug(Fore.RED, "check pool: %s %s (mismatch)", asset,
+                                  '{:+0,f}'.format((holdings[asset].quantity-
+                                                    self.totals[asset]).normalize()),
+                                  asset=asset)
 
                     self._log_failure(asset, self.totals[asset], holdings[asset].quantity)
                     passed = False
             else:
-                if config.debug:
-                    print("%scheck pool: %s (missing)" %(Fore.RED, asset))
+                log.debug(Fore.RED, "check pool: %s (missing)", asset, asset=asset)
 
                 self._log_failure(asset, self.totals[asset], None)
                 passed = False
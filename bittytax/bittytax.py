@@ -3,6 +3,7 @@
 # (c) Nano Nano Ltd 2019
 
 import argparse
+import atexit
 import io
 import sys
 import codecs
@@ -21,6 +22,11 @@ from .audit import AuditRecords
 from .price.valueasset import ValueAsset
 from .price.exceptions import DataSourceError
 from .tax import TaxCalculator, CalculateCapitalGains as CCG
+from .snapshots import Section104Snapshots
+from .import_cache import ImportCache
+from .profiler import profiler
+from .progress import progress
+from .log import setup_logging, logging_enabled, log_stages
 from .report import ReportLog, ReportPdf
 from .exceptions import ImportFailureError
 
@@ -80,9 +86,82 @@ def main():
     parser.add_argument('--export',
                         action='store_true',
                         help="export your transaction records populated with price data")
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=1,
+                        help="number of processes used to calculate disposals, "
+                             "assets are processed in parallel, default: 1")
+    parser.add_argument('--snapshot',
+                        action='store_true',
+                        help="save section 104 snapshots at each tax year end, "
+                             "and resume from them when calculating a tax year")
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help="when calculating all tax years, reuse the disposals from the "
+                             "previous run for any asset and tax year which is unchanged, "
+                             "implies --snapshot")
+    parser.add_argument('--cache',
+                        action='store_true',
+                        help="save the transaction records imported from a file to a cache, "
+                             "and load them from it next time if the file is unchanged")
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help="output the time, peak memory and number of items for each stage "
+                             "of processing")
+    parser.add_argument('--profile-json',
+                        dest='profile_json',
+                        metavar='FILENAME',
+                        type=str,
+                        help="write the profile to a JSON file, implies --profile")
+    parser.add_argument('--profile-stats',
+                        dest='profile_stats',
+                        metavar='DIRECTORY',
+                        type=str,
+                        help="write a cProfile stats file for each stage to a directory, "
+                             "implies --profile")
+    parser.add_argument('--progress-json',
+                        dest='progress_json',
+                        metavar='FILENAME',
+                        type=str,
+                        help="write the progress of each stage as JSON lines to a file, "
+                             "use - for standard error")
+    parser.add_argument('--log-file',
+                        dest='log_file',
+                        metavar='FILENAME',
+                        type=str,
+                        help="write debug logging to a file as JSON lines")
+    parser.add_argument('--log-stage',
+                        dest='log_stages',
+                        metavar='STAGE',
+                        nargs='+',
+                        choices=log_stages(),
+                        help="only debug log these stages {%s}" % ', '.join(log_stages()))
+    parser.add_argument('--log-asset',
+                        dest='log_assets',
+                        metavar='ASSET',
+                        nargs='+',
+                        type=str,
+                        help="only debug log these assets")
 
     args = parser.parse_args()
     config.debug = args.debug
+    setup_logging('stdout' if args.debug else None, args.log_file, args.log_stages,
+                  args.log_assets)
+
+    if args.progress_json == '-':
+        progress.set_stream(sys.stderr)
+    elif args.progress_json:
+        if sys.version_info[0] < 3:
+            progress_file = open(args.progress_json, 'w')
+        else:
+            progress_file = io.open(args.progress_json, 'w', encoding='utf-8')
+        # Closed however it exits, so the last line is always written
+        atexit.register(progress_file.close)
+        progress.set_stream(progress_file)
+
+    if args.profile or args.profile_json or args.profile_stats:
+        profiler.enable(args.profile_stats)
 
     if config.debug:
         print("%s%s v%s" % (Fore.YELLOW, parser.prog, __version__))
@@ -95,7 +174,9 @@ def main():
         config.start_of_year_day = 1
 
     try:
-        transaction_records = do_import(args.filename)
+        with profiler.stage('import') as stage:
+            transaction_records = do_import(args.filename, args.cache)
+            stage.count = len(transaction_records)
     except IOError:
         parser.exit("%sERROR%s File could not be read: %s" % (
             Back.RED+Fore.BLACK, Back.RESET+Fore.RED, args.filename))
@@ -103,20 +184,27 @@ def main():
         parser.exit()
 
     if args.export:
-        do_export(transaction_records)
+        with profiler.stage('export', len(transaction_records)):
+            do_export(transaction_records)
+        do_profile(parser.prog, args)
         parser.exit()
 
-    audit = AuditRecords(transaction_records)
+    # Audited when the records are split for the tax calculation
+    audit = AuditRecords()
 
     try:
-        tax, value_asset = do_tax(transaction_records, args.tax_rules, args.skip_integrity)
+        tax, value_asset = do_tax(transaction_records, args.tax_rules, args.skip_integrity,
+                                  args.jobs, args.taxyear, args.snapshot or args.incremental,
+                                  args.incremental, audit)
         if not args.skip_integrity:
-            int_passed = do_integrity_check(audit, tax.holdings)
+            with profiler.stage('integrity check', len(tax.holdings)):
+                int_passed = do_integrity_check(audit, tax.holdings)
             if not int_passed:
                 parser.exit()
 
         if not args.summary:
-            tax.process_income()
+            with profiler.stage('process income'):
+                tax.process_income()
 
         do_each_tax_year(tax,
                          args.taxyear,
@@ -127,19 +215,22 @@ def main():
         parser.exit("%sERROR%s %s" % (
             Back.RED+Fore.BLACK, Back.RESET+Fore.RED, e))
 
-    if args.nopdf:
-        ReportLog(audit,
-                  tax.tax_report,
-                  value_asset.price_report,
-                  tax.holdings_report,
-                  args)
-    else:
-        ReportPdf(parser.prog,
-                  audit,
-                  tax.tax_report,
-                  value_asset.price_report,
-                  tax.holdings_report,
-                  args)
+    with profiler.stage('report'):
+        if args.nopdf:
+            ReportLog(audit,
+                      tax.tax_report,
+                      value_asset.price_report,
+                      tax.holdings_report,
+                      args)
+        else:
+            ReportPdf(parser.prog,
+                      audit,
+                      tax.tax_report,
+                      value_asset.price_report,
+                      tax.holdings_report,
+                      args)
+
+    do_profile(parser.prog, args)
 
 def validate_year(value):
     year = int(value)
@@ -152,15 +243,26 @@ def validate_year(value):
 
     return year
 
-def do_import(filename):
+def do_import(filename, use_cache=False):
     import_records = ImportRecords()
+    import_cache = None
 
     if filename:
-        try:
-            import_records.import_excel(filename)
-        except xlrd.XLRDError:
-            with io.open(filename, newline='', encoding='utf-8') as csv_file:
-                import_records.import_csv(csv_file)
+        if use_cache:
+            import_cache = ImportCache(filename)
+            t_records = import_cache.load()
+        else:
+            t_records = None
+
+        if t_records is not None:
+            import_records.import_cached(filename, t_records)
+            import_cache = None
+        else:
+            try:
+                import_records.import_excel(filename)
+            except xlrd.XLRDError:
+                with io.open(filename, newline='', encoding='utf-8') as csv_file:
+                    import_records.import_csv(csv_file)
     else:
         if sys.version_info[0] < 3:
             import_records.import_csv(codecs.getreader('utf-8')(sys.stdin))
@@ -174,22 +276,51 @@ def do_import(filename):
     if import_records.failure_cnt > 0:
         raise ImportFailureError
 
+    if import_cache:
+        # Saved before the records are sorted and given their IDs
+        import_cache.dump(import_records.t_records)
+
     return import_records.get_records()
 
-def do_tax(transaction_records, tax_rules, skip_integrity_check):
+def do_tax(transaction_records, tax_rules, skip_integrity_check, jobs=1, tax_year=None,
+           snapshot=False, incremental=False, audit=None):
     value_asset = ValueAsset()
-    transaction_history = TransactionHistory(transaction_records, value_asset)
+    with profiler.stage('prefetch prices', len(transaction_records)):
+        value_asset.prefetch_historical_prices(
+            TransactionHistory.price_lookups(transaction_records))
+
+    with profiler.stage('split', len(transaction_records)):
+        transaction_history = TransactionHistory(transaction_records, value_asset, audit)
+
+    tax = TaxCalculator(transaction_history.transactions, tax_rules,
+                        transaction_history.income_transactions)
+    if snapshot:
+        with profiler.stage('resume snapshots', len(tax.transactions)):
+            snapshots = Section104Snapshots(tax_rules)
+            if tax_year:
+                # Earlier tax years are not reported, so only need processing if changed
+                tax.resume(snapshots, tax_year, skip_integrity_check)
+            elif incremental:
+                # Only process from the first tax year which has changed
+                tax.resume(snapshots, None, skip_integrity_check)
+
+    if jobs > 1 and logging_enabled():
+        # Debug logging is only possible when processed in order
+        print("%sWARNING%s Option --jobs is ignored when debug logging is turned on "
+              "(-d or --log-file), disposals are processed in order" % (
+                  Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW))
+        jobs = 1
 
-    tax = TaxCalculator(transaction_history.transactions, tax_rules)
-    tax.pool_same_day()
-    tax.match_sell(tax.DISPOSAL_SAME_DAY)
+    if jobs > 1:
+        with profiler.stage('process disposals', len(tax.transactions)):
+            tax.process_disposals_by_asset(jobs, skip_integrity_check)
+    else:
+        tax.process_disposals(skip_integrity_check)
 
-    if tax_rules == config.TAX_RULES_UK_INDIVIDUAL:
-        tax.match_buyback(tax.DISPOSAL_BED_AND_BREAKFAST)
-    elif tax_rules in config.TAX_RULES_UK_COMPANY:
-        tax.match_sell(tax.DISPOSAL_TEN_DAY)
+    if snapshot:
+        with profiler.stage('save snapshots', len(tax.transactions)):
+            snapshots.dump(tax.snapshots, tax.snapshot_keys(skip_integrity_check))
 
-    tax.process_section104(skip_integrity_check)
     return tax, value_asset
 
 def do_integrity_check(audit, holdings):
@@ -232,9 +363,7 @@ def do_each_tax_year(tax, tax_year, summary, value_asset):
             Fore.CYAN,
             config.format_tax_year(tax_year)))
 
-        tax.calculate_capital_gains(tax_year)
-        if not summary:
-            tax.calculate_income(tax_year)
+        do_calculate(tax, tax_year, summary)
     else:
         # Calculate for all years
         for year in sorted(tax.tax_events):
@@ -243,18 +372,36 @@ def do_each_tax_year(tax, tax_year, summary, value_asset):
                 config.format_tax_year(year)))
 
             if year in CCG.CG_DATA_INDIVIDUAL:
-                tax.calculate_capital_gains(year)
-                if not summary:
-                    tax.calculate_income(year)
+                do_calculate(tax, year, summary)
             else:
                 print("%sWARNING%s Tax year %s is not supported" % (
                     Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW, year))
 
         if not summary:
-            tax.calculate_holdings(value_asset)
+            with profiler.stage('calculate holdings', len(tax.holdings)):
+                tax.calculate_holdings(value_asset)
 
     return tax, value_asset
 
+def do_calculate(tax, tax_year, summary):
+    with profiler.stage('calculate capital gains', len(tax.tax_events.get(tax_year, []))):
+        tax.calculate_capital_gains(tax_year)
+
+    if not summary:
+        with profiler.stage('calculate income', len(tax.tax_events.get(tax_year, []))):
+            tax.calculate_income(tax_year)
+
+def do_profile(prog, args):
+    if not profiler.enabled:
+        return
+
+    profiler.output()
+
+    if args.profile_json:
+        profiler.write_json(args.profile_json, prog)
+
+    profiler.write_stats()
+
 def do_export(transaction_records):
     value_asset = ValueAsset()
     TransactionHistory(transaction_records, value_asset)
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 # (c) Nano Nano Ltd 2019
 
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
+from bisect import bisect_right
 
 import os
 import pkg_resources
@@ -42,6 +43,9 @@ class Config(object):
     TRADE_ALLOWABLE_COST_SELL = 1
     TRADE_ALLOWABLE_COST_SPLIT = 2
 
+    # Range of tax years held in the calendar
+    TAX_YEAR_CALENDAR = (1970, 2100)
+
     DATA_SOURCE_FIAT = ['BittyTaxAPI']
     DATA_SOURCE_CRYPTO = ['CryptoCompare', 'CoinGecko']
 
@@ -59,6 +63,11 @@ class Config(object):
         'data_source_select': {},
         'data_source_fiat': DATA_SOURCE_FIAT,
         'data_source_crypto': DATA_SOURCE_CRYPTO,
+        'data_source_timeout': {},
+        'data_source_retries': 3,
+        'data_source_backoff': 1.0,
+        'data_source_rate_limit': {},
+        'data_source_list_ttl': 24,
         'coinbase_zero_fees_are_gifts': False,
     }
 
@@ -66,6 +75,7 @@ class Config(object):
         self.debug = False
         self.start_of_year_month = 4
         self.start_of_year_day = 6
+        self.tax_year_calendar = None
 
         if not os.path.exists(Config.BITTYTAX_PATH):
             os.mkdir(Config.BITTYTAX_PATH)
@@ -140,6 +150,44 @@ class Config(object):
                         self.start_of_year_day,
                         tzinfo=config.TZ_LOCAL) - timedelta(microseconds=1)
 
+    def get_tax_year(self, timestamp):
+        if timestamp.tzinfo is not self.TZ_LOCAL:
+            timestamp = timestamp.astimezone(self.TZ_LOCAL)
+
+        return self.get_tax_year_of_day(timestamp.toordinal())
+
+    def get_tax_year_of_day(self, day):
+        # Day is the ordinal of the local date
+        if not self.tax_year_calendar or \
+                self.tax_year_calendar[0] != self.start_of_year_month or \
+                self.tax_year_calendar[1] != self.start_of_year_day:
+            self.tax_year_calendar = self.get_tax_year_calendar()
+
+        first_tax_year, start_days = self.tax_year_calendar[2:]
+        i = bisect_right(start_days, day) - 1
+        if 0 <= i < len(start_days) - 1:
+            return first_tax_year + i
+
+        # Outside of the calendar
+        year = date.fromordinal(day).year
+        if day > self.get_tax_year_days(year)[1]:
+            return year + 1
+        return year
+
+    def get_tax_year_days(self, tax_year):
+        # First and last day of the tax year, as day ordinals
+        return self.get_tax_year_start(tax_year).toordinal(), \
+               self.get_tax_year_end(tax_year).toordinal()
+
+    def get_tax_year_calendar(self):
+        # Day each tax year starts, for the current start of the year
+        first_tax_year, last_tax_year = self.TAX_YEAR_CALENDAR
+        return (self.start_of_year_month,
+                self.start_of_year_day,
+                first_tax_year,
+                [self.get_tax_year_start(tax_year).toordinal()
+                 for tax_year in range(first_tax_year, last_tax_year + 2)])
+
     def format_tax_year(self, tax_year):
         start = self.get_tax_year_start(tax_year)
         end = self.get_tax_year_end(tax_year)
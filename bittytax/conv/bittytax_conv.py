@@ -14,6 +14,8 @@ import xlrd
 
 from ..version import __version__
 from ..config import config
+from ..profiler import profiler
+from ..log import setup_logging, log_stages
 from .dataparser import DataParser
 from .datafile import DataFile
 from .datamerge import DataMerge
@@ -80,11 +82,49 @@ def main():
                         dest='output_filename',
                         type=str,
                         help="specify the output filename")
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help="output the time, peak memory and number of items for each stage "
+                             "of processing")
+    parser.add_argument('--profile-json',
+                        dest='profile_json',
+                        metavar='FILENAME',
+                        type=str,
+                        help="write the profile to a JSON file, implies --profile")
+    parser.add_argument('--profile-stats',
+                        dest='profile_stats',
+                        metavar='DIRECTORY',
+                        type=str,
+                        help="write a cProfile stats file for each stage to a directory, "
+                             "implies --profile")
+    parser.add_argument('--log-file',
+                        dest='log_file',
+                        metavar='FILENAME',
+                        type=str,
+                        help="write debug logging to a file as JSON lines")
+    parser.add_argument('--log-stage',
+                        dest='log_stages',
+                        metavar='STAGE',
+                        nargs='+',
+                        choices=log_stages(),
+                        help="only debug log these stages {%s}" % ', '.join(log_stages()))
+    parser.add_argument('--log-asset',
+                        dest='log_assets',
+                        metavar='ASSET',
+                        nargs='+',
+                        type=str,
+                        help="only debug log these assets")
 
     args = parser.parse_args()
     config.debug = args.debug
+    # Price lookups are debugged to stdout, the same as the other tools
+    setup_logging('stderr' if args.debug else None, args.log_file, args.log_stages,
+                  args.log_assets, stage_streams={'price': 'stdout'})
     DataFile.remove_duplicates = args.duplicates
 
+    if args.profile or args.profile_json or args.profile_stats:
+        profiler.enable(args.profile_stats)
+
     if config.debug:
         sys.stderr.write("%s%s v%s\n" % (Fore.YELLOW, parser.prog, __version__))
         sys.stderr.write("%spython: v%s\n" % (Fore.GREEN, platform.python_version()))
@@ -98,7 +138,8 @@ def main():
 
         for pathname in pathnames:
             try:
-                do_read_file(pathname, args)
+                with profiler.stage('read file', 1):
+                    do_read_file(pathname, args)
             except UnknownCryptoassetError as e:
                 sys.stderr.write(Fore.RESET)
                 parser.error("%s, please specify using the [-ca CRYPTOASSET] option" % e)
@@ -124,16 +165,28 @@ def main():
                         Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW, pathname))
 
     if DataFile.data_files:
-        DataMerge.match_merge(DataFile.data_files)
-
-        if args.format == config.FORMAT_EXCEL:
-            output = OutputExcel(parser.prog, DataFile.data_files_ordered, args)
-            output.write_excel()
-        else:
-            output = OutputCsv(DataFile.data_files_ordered, args)
-            sys.stderr.write(Fore.RESET)
-            sys.stderr.flush()
-            output.write_csv()
+        with profiler.stage('merge', len(DataFile.data_files)):
+            DataMerge.match_merge(DataFile.data_files)
+
+        with profiler.stage('output', sum(len(data_file.data_rows)
+                                          for data_file in DataFile.data_files_ordered)):
+            if args.format == config.FORMAT_EXCEL:
+                output = OutputExcel(parser.prog, DataFile.data_files_ordered, args)
+                output.write_excel()
+            else:
+                output = OutputCsv(DataFile.data_files_ordered, args)
+                sys.stderr.write(Fore.RESET)
+                sys.stderr.flush()
+                output.write_csv()
+
+    if profiler.enabled:
+        # Standard output may be used for the CSV output
+        profiler.output(sys.stderr)
+
+        if args.profile_json:
+            profiler.write_json(args.profile_json, parser.prog)
+
+        profiler.write_stats()
 
 def do_read_file(pathname, args):
     try:
@@ -8,11 +8,13 @@ import io
 from colorama import Fore, Back
 import xlrd
 
-from ..config import config
+from ..log import get_log
 from .dataparser import DataParser
 from .datarow import DataRow
 from .exceptions import DataFormatUnrecognised
 
+log = get_log('conv')
+
 class DataFile(object):
     CSV_DELIMITERS = (',', ';')
 
@@ -48,9 +50,8 @@ class DataFile(object):
     def parse(self, **kwargs):
         if self.parser.row_handler:
             for data_row in self.data_rows:
-                if config.debug:
-                    sys.stderr.write("%sconv: row[%s] %s\n" % (
-                        Fore.YELLOW, self.parser.in_header_row_num + data_row.line_num, data_row))
+                log.debug(Fore.YELLOW, "conv: row[%s] %s",
+                          self.parser.in_header_row_num + data_row.line_num, data_row)
 
                 data_row.parse(self.parser, **kwargs)
         else:
@@ -62,8 +63,7 @@ class DataFile(object):
     @classmethod
     def read_excel(cls, filename):
         with xlrd.open_workbook(filename) as workbook:
-            if config.debug:
-                sys.stderr.write("%sconv: EXCEL\n" % Fore.CYAN)
+            log.debug(Fore.CYAN, "conv: EXCEL")
 
             for worksheet in workbook.sheets():
                 yield worksheet, workbook.datemode
@@ -152,8 +152,7 @@ class DataFile(object):
     def read_csv_with_delimiter(cls, filename):
         with io.open(filename, newline='', encoding='utf-8-sig') as csv_file:
             for delimiter in cls.CSV_DELIMITERS:
-                if config.debug:
-                    sys.stderr.write("%sconv: CSV delimiter='%s'\n" % (Fore.CYAN, delimiter))
+                log.debug(Fore.CYAN, "conv: CSV delimiter='%s'", delimiter)
 
                 if sys.version_info[0] < 3:
                     # special handling required for utf-8 encoded csv files
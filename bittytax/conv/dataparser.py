@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 # (c) Nano Nano Ltd 2019
 
-import sys
 from decimal import Decimal
 from datetime import datetime
 
@@ -10,10 +9,14 @@ import dateutil.parser
 import dateutil.tz
 
 from ..config import config
+from ..log import get_log
 from ..price.pricedata import PriceData
 
 TERM_WIDTH = 69
 
+log = get_log('conv')
+price_log = get_log('price')
+
 class DataParser(object):
     TYPE_WALLET = 'Wallets'
     TYPE_EXCHANGE = 'Exchanges'
@@ -104,28 +107,27 @@ class DataParser(object):
 
         value_in_ccy = Decimal(value) * rate_ccy
 
-        if config.debug:
-            print("%sprice: %s, 1 %s=%s %s, %s %s=%s%s %s%s" % (
-                    Fore.YELLOW,
-                    timestamp.strftime('%Y-%m-%d'),
-                    from_currency,
-                    config.sym() + '{:0,.2f}'.format(rate_ccy),
-                    config.ccy,
-                    '{:0,f}'.format(Decimal(value).normalize()),
-                    from_currency,
-                    Style.BRIGHT,
-                    config.sym() + '{:0,.2f}'.format(value_in_ccy),
-                    config.ccy,
-                    Style.NORMAL))
+        if price_log.is_debug(from_currency):
+            price_log.debug(Fore.YELLOW, "price: %s, 1 %s=%s %s, %s %s=%s%s %s%s",
+                            timestamp.strftime('%Y-%m-%d'),
+                            from_currency,
+                            config.sym() + '{:0,.2f}'.format(rate_ccy),
+                            config.ccy,
+                            '{:0,f}'.format(Decimal(value).normalize()),
+                            from_currency,
+                            Style.BRIGHT,
+                            config.sym() + '{:0,.2f}'.format(value_in_ccy),
+                            config.ccy,
+                            Style.NORMAL,
+                            asset=from_currency)
 
         return value_in_ccy
 
     @classmethod
     def match_header(cls, row, row_num):
         row = [col.strip() for col in row]
-        if config.debug:
-            sys.stderr.write("%sheader: row[%s] TRY: %s\n" % (
-                Fore.YELLOW, row_num+1, cls.format_row(row)))
+        if log.is_debug():
+            log.debug(Fore.YELLOW, "header: row[%s] TRY: %s", row_num+1, cls.format_row(row))
 
         parsers_reduced = [p for p in cls.parsers if len(p.header) == len(row)]
         for parser in parsers_reduced:
@@ -141,16 +143,16 @@ class DataParser(object):
                     break
 
             if match:
-                if config.debug:
-                    sys.stderr.write("%sheader: row[%s] MATCHED: %s as '%s'\n" % (
-                        Fore.CYAN, row_num+1, cls.format_row(parser.header), parser.name))
+                if log.is_debug():
+                    log.debug(Fore.CYAN, "header: row[%s] MATCHED: %s as '%s'",
+                              row_num+1, cls.format_row(parser.header), parser.name)
                 parser.in_header = row
                 parser.in_header_row_num = row_num + 1
                 return parser
 
-            if config.debug:
-                sys.stderr.write("%sheader: row[%s] NO MATCH: %s '%s'\n" % (
-                    Fore.BLUE, row_num+1, cls.format_row(parser.header), parser.name))
+            if log.is_debug():
+                log.debug(Fore.BLUE, "header: row[%s] NO MATCH: %s '%s'",
+                          row_num+1, cls.format_row(parser.header), parser.name)
 
         raise KeyError
 
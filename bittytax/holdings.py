@@ -7,6 +7,9 @@ from colorama import Fore, Back
 from tqdm import tqdm
 
 from .config import config
+from .log import get_log
+
+log = get_log('section104')
 
 class Holdings(object):
     def __init__(self, asset):
@@ -26,20 +29,21 @@ class Holdings(object):
         if is_deposit:
             self.deposits += 1
 
-        if config.debug:
-            print("%ssection104:   %s=%s (+%s) cost=%s %s (+%s %s) fees=%s %s (+%s %s)" % (
-                Fore.YELLOW,
-                self.asset,
-                '{:0,f}'.format(self.quantity.normalize()),
-                '{:0,f}'.format(quantity.normalize()),
-                config.sym() + '{:0,.2f}'.format(self.cost),
-                config.ccy,
-                config.sym() + '{:0,.2f}'.format(cost),
-                config.ccy,
-                config.sym() + '{:0,.2f}'.format(self.fees),
-                config.ccy,
-                config.sym() + '{:0,.2f}'.format(fees),
-                config.ccy))
+        if log.is_debug(self.asset):
+            log.debug(Fore.YELLOW,
+                      "section104:   %s=%s (+%s) cost=%s %s (+%s %s) fees=%s %s (+%s %s)",
+                      self.asset,
+                      '{:0,f}'.format(self.quantity.normalize()),
+                      '{:0,f}'.format(quantity.normalize()),
+                      config.sym() + '{:0,.2f}'.format(self.cost),
+                      config.ccy,
+                      config.sym() + '{:0,.2f}'.format(cost),
+                      config.ccy,
+                      config.sym() + '{:0,.2f}'.format(self.fees),
+                      config.ccy,
+                      config.sym() + '{:0,.2f}'.format(fees),
+                      config.ccy,
+                      asset=self.asset)
 
     def subtract_tokens(self, quantity, cost, fees, is_withdrawal):
         self.quantity -= quantity
@@ -49,20 +53,21 @@ class Holdings(object):
         if is_withdrawal:
             self.withdrawals += 1
 
-        if config.debug:
-            print("%ssection104:   %s=%s (-%s) cost=%s %s (-%s %s) fees=%s %s (-%s %s)" % (
-                Fore.YELLOW,
-                self.asset,
-                '{:0,f}'.format(self.quantity.normalize()),
-                '{:0,f}'.format(quantity.normalize()),
-                config.sym() + '{:0,.2f}'.format(self.cost),
-                config.ccy,
-                config.sym() + '{:0,.2f}'.format(cost),
-                config.ccy,
-                config.sym() + '{:0,.2f}'.format(self.fees),
-                config.ccy,
-                config.sym() + '{:0,.2f}'.format(fees),
-                config.ccy))
+        if log.is_debug(self.asset):
+            log.debug(Fore.YELLOW,
+                      "section104:   %s=%s (-%s) cost=%s %s (-%s %s) fees=%s %s (-%s %s)",
+                      self.asset,
+                      '{:0,f}'.format(self.quantity.normalize()),
+                      '{:0,f}'.format(quantity.normalize()),
+                      config.sym() + '{:0,.2f}'.format(self.cost),
+                      config.ccy,
+                      config.sym() + '{:0,.2f}'.format(cost),
+                      config.ccy,
+                      config.sym() + '{:0,.2f}'.format(self.fees),
+                      config.ccy,
+                      config.sym() + '{:0,.2f}'.format(fees),
+                      config.ccy,
+                      asset=self.asset)
 
     def check_transfer_mismatch(self):
         if self.withdrawals > 0 and self.withdrawals != self.deposits:
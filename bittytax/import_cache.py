@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import os
+import sys
+import json
+import hashlib
+
+from colorama import Fore, Back
+
+from .version import __version__
+from .config import config
+from .log import get_log
+
+if sys.version_info[0] < 3:
+    import cPickle as pickle
+else:
+    import pickle
+
+log = get_log('cache')
+import_log = get_log('import')
+
+class ImportCache(object):
+    # Transaction records parsed from a file, persisted between runs. They are only reused if
+    #  the file's contents, the parser and the config it depends upon are all unchanged. The
+    #  records are pickled, so they are kept in their own folder which only the user can access,
+    #  and a cache which anyone else could have written to is never loaded
+    PARSER_VERSION = 1
+    DIRECTORY = 'imports'
+
+    def __init__(self, filename):
+        self.directory = os.path.join(config.CACHE_DIR, self.DIRECTORY)
+        self.filename = os.path.join(self.directory, 'Import_%s.pickle' % hashlib.sha1(
+            os.path.abspath(filename).encode('utf-8')).hexdigest())
+        self.key = self.file_key(filename)
+
+        if not os.path.exists(config.CACHE_DIR):
+            os.mkdir(config.CACHE_DIR)
+
+        if not os.path.exists(self.directory):
+            os.mkdir(self.directory, 0o700)
+
+    def file_key(self, filename):
+        key = hashlib.sha1(("%s|%s|%s|%s\n" % (
+            __version__,
+            self.PARSER_VERSION,
+            sys.version_info[0],
+            json.dumps(config.config, sort_keys=True, default=str))).encode('utf-8'))
+
+        with open(filename, 'rb') as import_file:
+            for chunk in iter(lambda: import_file.read(1024 * 1024), b''):
+                key.update(chunk)
+
+        return key.hexdigest()
+
+    def load(self):
+        if import_log.is_debug() or not os.path.exists(self.filename):
+            # Rows are only logged as they are parsed
+            return None
+
+        if not self._is_private(self.directory) or not self._is_private(self.filename):
+            print("%sWARNING%s Cache of imported transaction records is not private, "
+                  "it has not been loaded: %s" % (
+                      Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW, self.filename))
+            return None
+
+        try:
+            with open(self.filename, 'rb') as import_cache:
+                key = pickle.load(import_cache)
+                if key != self.key:
+                    log.debug(Fore.GREEN, "cache: \"%s\" is out of date", self.filename)
+                    return None
+
+                t_records = pickle.load(import_cache)
+        except:
+            print("%sWARNING%s Cache of imported transaction records could not be loaded" % (
+                Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW))
+            return None
+
+        log.debug(Fore.GREEN, "cache: loaded from \"%s\"", self.filename)
+        return self._restore_tz(t_records)
+
+    def dump(self, t_records):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+        # Created so only the user can read or write it
+        with os.fdopen(os.open(self.filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                               getattr(os, 'O_BINARY', 0), 0o600), 'wb') as import_cache:
+            # Key is first, so an out of date cache can be skipped without loading the records
+            pickle.dump(self.key, import_cache, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(t_records, import_cache, pickle.HIGHEST_PROTOCOL)
+
+        log.debug(Fore.GREEN, "cache: saved to \"%s\"", self.filename)
+
+    @staticmethod
+    def _is_private(path):
+        # Owned by the user, and no one else can write to it
+        if not hasattr(os, 'getuid'):
+            return True
+
+        stat = os.stat(path)
+        return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+    @staticmethod
+    def _restore_tz(t_records):
+        # Timezones are copies once unpickled, restore them so timestamps compare the same.
+        #  Records from the same timezone share the copy, so each is only looked up once
+        timezones = {}
+        for tr in t_records:
+            tzinfo = tr.timestamp.tzinfo
+            if id(tzinfo) not in timezones:
+                timezones[id(tzinfo)] = config_tz(tzinfo)
+
+            tr.timestamp = tr.timestamp.replace(tzinfo=timezones[id(tzinfo)])
+            timestamp = None
+            for t in (tr.buy, tr.sell, tr.fee):
+                if t:
+                    if timestamp is None:
+                        timestamp = t.timestamp.replace(tzinfo=config.TZ_LOCAL)
+                    t.timestamp = timestamp
+
+        return t_records
+
+def config_tz(tzinfo):
+    for tz in [config.TZ_UTC, config.TZ_LOCAL] + list(config.TZ_INFOS.values()):
+        if type(tz) is type(tzinfo) and tz == tzinfo:
+            return tz
+    return tzinfo
@@ -6,20 +6,26 @@ import csv
 from decimal import Decimal, InvalidOperation
 
 from colorama import Fore, Back
-from tqdm import tqdm, trange
+from tqdm import tqdm
 import dateutil.parser
 import xlrd
 
 from .config import config
 from .transactions import Buy, Sell
 from .record import TransactionRecord as TR
+from .progress import progress
+from .log import get_log
 from .exceptions import TransactionParserError, UnexpectedTransactionTypeError, \
                         TimestampParserError, DataValueError, MissingDataError, \
                         UnexpectedDataError
 
+log = get_log('import')
+
 class ImportRecords(object):
     def __init__(self):
+        # Rows are not kept once parsed, unless they are needed for debug logging
         self.t_rows = []
+        self.t_records = []
         self.success_cnt = 0
         self.failure_cnt = 0
 
@@ -31,14 +37,11 @@ class ImportRecords(object):
             if worksheet.name.startswith('--'):
                 print("%sskipping '%s' worksheet" % (Fore.GREEN, worksheet.name))
                 continue
-            if config.debug:
-                print("%simporting '%s' rows" % (Fore.CYAN, worksheet.name))
-
-            for row_num in trange(0, worksheet.nrows,
-                                  unit=' row',
-                                  desc="%simporting '%s' rows%s" % (
-                                      Fore.CYAN, worksheet.name, Fore.GREEN),
-                                  disable=bool(config.debug or not sys.stdout.isatty())):
+            log.debug(Fore.CYAN, "importing '%s' rows", worksheet.name)
+
+            for row_num in progress(range(0, worksheet.nrows),
+                                    "importing '%s' rows" % worksheet.name,
+                                    unit=' row'):
                 if row_num == 0:
                     # skip headers
                     continue
@@ -52,15 +55,14 @@ class ImportRecords(object):
                 except TransactionParserError as e:
                     t_row.failure = e
 
-                if config.debug or t_row.failure:
-                    tqdm.write("%simport: %s" % (Fore.YELLOW, t_row))
-
                 if t_row.failure:
+                    tqdm.write("%simport: %s" % (Fore.YELLOW, t_row))
                     tqdm.write("%sERROR%s %s" % (
                         Back.RED+Fore.BLACK, Back.RESET+Fore.RED, t_row.failure))
+                elif log.is_debug():
+                    log.debug(Fore.YELLOW, "import: %s", t_row, asset=t_row.assets())
 
-                self.t_rows.append(t_row)
-                self.update_cnts(t_row)
+                self.add_row(t_row)
 
         workbook.release_resources()
         del workbook
@@ -86,8 +88,7 @@ class ImportRecords(object):
 
     def import_csv(self, import_file):
         print("%sCSV file: %s%s" % (Fore.WHITE, Fore.YELLOW, import_file.name))
-        if config.debug:
-            print("%simporting rows" % Fore.CYAN)
+        log.debug(Fore.CYAN, "importing rows")
 
         if sys.version_info[0] < 3:
             # Special handling required for utf-8 encoded csv files
@@ -95,10 +96,7 @@ class ImportRecords(object):
         else:
             reader = csv.reader(import_file)
 
-        for row in tqdm(reader,
-                        unit=' row',
-                        desc="%simporting%s" % (Fore.CYAN, Fore.GREEN),
-                        disable=bool(config.debug or not sys.stdout.isatty())):
+        for row in progress(reader, "importing", unit=' row'):
             if reader.line_num == 1:
                 # skip headers
                 continue
@@ -109,21 +107,34 @@ class ImportRecords(object):
             except TransactionParserError as e:
                 t_row.failure = e
 
-            if config.debug or t_row.failure:
-                tqdm.write("%simport: %s" % (Fore.YELLOW, t_row))
-
             if t_row.failure:
+                tqdm.write("%simport: %s" % (Fore.YELLOW, t_row))
                 tqdm.write("%sERROR%s %s" % (
                     Back.RED+Fore.BLACK, Back.RESET+Fore.RED, t_row.failure))
+            elif log.is_debug():
+                log.debug(Fore.YELLOW, "import: %s", t_row, asset=t_row.assets())
 
-            self.t_rows.append(t_row)
-            self.update_cnts(t_row)
+            self.add_row(t_row)
+
+    def import_cached(self, filename, t_records):
+        print("%sCached file: %s%s" % (Fore.WHITE, Fore.YELLOW, filename))
+        self.t_records = t_records
+        self.success_cnt = len(t_records)
 
     @staticmethod
     def utf_8_encoder(unicode_csv_data):
         for line in unicode_csv_data:
             yield line.encode('utf-8')
 
+    def add_row(self, t_row):
+        if t_row.t_record:
+            self.t_records.append(t_row.t_record)
+
+        if log.is_debug():
+            self.t_rows.append(t_row)
+
+        self.update_cnts(t_row)
+
     def update_cnts(self, t_row):
         if t_row.failure is not None:
             self.failure_cnt += 1
@@ -131,15 +142,16 @@ class ImportRecords(object):
             self.success_cnt += 1
 
     def get_records(self):
-        transaction_records = [t_row.t_record for t_row in self.t_rows if t_row.t_record]
+        transaction_records = self.t_records
 
-        transaction_records.sort()
+        # Sorted on UTC time, worked out once for each record, rather than comparing timestamps
+        #  which may be in different timezones
+        transaction_records.sort(key=lambda tr: tr.timestamp.astimezone(config.TZ_UTC))
         for t_record in transaction_records:
             t_record.set_tid()
 
-        if config.debug:
-            for t_row in self.t_rows:
-                print("%simport: %s" % (Fore.YELLOW, t_row))
+        for t_row in self.t_rows:
+            log.debug(Fore.YELLOW, "import: %s", t_row, asset=t_row.assets())
 
         return transaction_records
 
@@ -333,6 +345,11 @@ class TransactionRow(object):
     def strip_non_digits(string):
         return string.strip('£€$').replace(',', '')
 
+    def assets(self):
+        if self.t_record:
+            return self.t_record.assets()
+        return None
+
     def __str__(self):
         if self.t_record and self.t_record.tid:
             tid_str = " %s[TID:%s]" % (Fore.MAGENTA, self.t_record.tid[0])
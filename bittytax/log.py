@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import re
+import sys
+import json
+import logging
+import logging.handlers
+
+LOGGER = 'bittytax'
+ANSI_CODES = re.compile(r'\x1b\[[0-9;]*m')
+
+class Log(object):
+    # Debug logging for a stage of processing (i.e. import, audit, split, pool, match,
+    #  section104), which can be limited to some stages or assets. Messages are only formatted
+    #  if they are output, any which are expensive to build should check is_debug() first
+    logs = {}
+    output = False
+    stages = None
+    assets = None
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.logger = logging.getLogger('%s.%s' % (LOGGER, stage))
+        self.enabled = False
+        self.update()
+
+    def update(self):
+        self.enabled = Log.output and (Log.stages is None or self.stage in Log.stages)
+
+    def is_debug(self, asset=None):
+        if not self.enabled:
+            return False
+
+        if asset is None or Log.assets is None:
+            return True
+
+        if isinstance(asset, (tuple, list)):
+            return not Log.assets.isdisjoint(asset)
+        return asset in Log.assets
+
+    def debug(self, colour, msg, *args, **kwargs):
+        # Asset can be a tuple, for messages about a transaction record
+        asset = kwargs.get('asset')
+        if self.is_debug(asset):
+            self.logger.debug(msg, *args, extra={'colour': colour, 'asset': asset})
+
+class ConsoleHandler(logging.Handler):
+    # Written to the stream as it is at the time, the same as print, so output can still be
+    #  captured by replacing it. Some stages can be written to a different stream
+    def __init__(self, stream_name, stage_streams=None):
+        super(ConsoleHandler, self).__init__()
+        self.stream_name = stream_name
+        self.stage_streams = stage_streams or {}
+
+    def emit(self, record):
+        stream_name = self.stage_streams.get(record.name[len(LOGGER) + 1:], self.stream_name)
+        try:
+            getattr(sys, stream_name).write(self.format(record) + '\n')
+        except Exception: # pylint: disable=broad-except
+            self.handleError(record)
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        return "%s%s" % (getattr(record, 'colour', ''), record.getMessage())
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        asset = getattr(record, 'asset', None)
+        if asset is None:
+            assets = []
+        elif isinstance(asset, (tuple, list)):
+            assets = list(asset)
+        else:
+            assets = [asset]
+
+        return json.dumps({'time': round(record.created, 6),
+                           'level': record.levelname,
+                           'stage': record.name[len(LOGGER) + 1:],
+                           'assets': assets,
+                           'message': ANSI_CODES.sub('', record.getMessage())})
+
+def get_log(stage):
+    if stage not in Log.logs:
+        Log.logs[stage] = Log(stage)
+    return Log.logs[stage]
+
+def setup_logging(console=None, filename=None, stages=None, assets=None, stage_streams=None):
+    # Console is the name of the stream (stdout or stderr) for coloured output, unless the
+    #  stage is mapped to another stream in stage_streams. The file is JSON lines, which are
+    #  buffered
+    logger = logging.getLogger(LOGGER)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        if isinstance(handler, logging.handlers.MemoryHandler):
+            target = handler.target
+            handler.close()
+            target.close()
+        else:
+            handler.close()
+
+    if console:
+        handler = ConsoleHandler(console, stage_streams)
+        handler.setFormatter(ConsoleFormatter())
+        logger.addHandler(handler)
+
+    if filename:
+        if sys.version_info[0] < 3:
+            file_handler = logging.FileHandler(filename, 'w')
+        else:
+            file_handler = logging.FileHandler(filename, 'w', encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+        logger.addHandler(logging.handlers.MemoryHandler(1000, logging.ERROR, file_handler))
+
+    Log.output = bool(logger.handlers)
+    Log.stages = set(stages) if stages else None
+    Log.assets = set(assets) if assets else None
+
+    for log in Log.logs.values():
+        log.update()
+
+def logging_enabled():
+    return any(log.enabled for log in Log.logs.values())
+
+def log_stages():
+    return sorted(Log.logs)
@@ -14,6 +14,7 @@ import dateutil.parser
 
 from ..version import __version__
 from ..config import config
+from ..log import setup_logging
 from .datasource import DataSourceBase
 from .assetdata import AssetData
 from .valueasset import ValueAsset
@@ -133,6 +134,7 @@ def main():
 
     args = parser.parse_args()
     config.debug = args.debug
+    setup_logging('stdout' if args.debug else None)
 
     if config.debug:
         print("%s%s v%s" % (Fore.YELLOW, parser.prog, __version__))
@@ -1,21 +1,26 @@
 # -*- coding: utf-8 -*-
 # (c) Nano Nano Ltd 2019
 
-import os
-import atexit
-import json
 import platform
+import time
 from decimal import Decimal
 from datetime import datetime, timedelta
 
 from colorama import Fore, Back
 import dateutil.parser
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ..version import __version__
 from ..config import config
+from ..log import get_log
+from .pricecache import PriceCache
+from .ratelimit import RateLimiter
 from .exceptions import UnexpectedDataSourceAssetIdError
 
+log = get_log('price')
+
 CRYPTOCOMPARE_MAX_DAYS = 2000
 COINPAPRIKA_MAX_DAYS = 5000
 
@@ -24,38 +29,100 @@ class DataSourceBase(object):
                                                   platform.python_version(),
                                                   platform.system(), platform.release())
     TIME_OUT = 30
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    # Requests allowed within a number of seconds, None is no limit
+    RATE_LIMIT = None
 
     def __init__(self):
         self.assets = {}
         self.ids = {}
-        self.prices = self.load_prices()
-
-        for pair in sorted(self.prices):
-            if config.debug:
-                print("%sprice: %s (%s) data cache loaded" % (Fore.YELLOW, self.name(), pair))
-
-        atexit.register(self.dump_prices)
+        self.prices = PriceCache(self.name())
+        self.time_out = config.data_source_timeout.get(self.name(), self.TIME_OUT)
+        self.session = self.get_session()
+        self.rate_limiter = RateLimiter(*(config.data_source_rate_limit.get(self.name(),
+                                                                           self.RATE_LIMIT)
+                                          or ()))
 
     def name(self):
         return self.__class__.__name__
 
+    def get_session(self):
+        # Connections are kept open and reused. Requests which fail, or are rate limited, are
+        #  retried with an exponential backoff, or after the time given by Retry-After
+        retry = Retry(total=config.data_source_retries,
+                      backoff_factor=config.data_source_backoff,
+                      status_forcelist=self.RETRY_STATUS,
+                      respect_retry_after_header=True,
+                      raise_on_status=False)
+
+        session = requests.Session()
+        session.headers['User-Agent'] = self.USER_AGENT
+        session.mount('https://', HTTPAdapter(max_retries=retry))
+        session.mount('http://', HTTPAdapter(max_retries=retry))
+        return session
+
     def get_json(self, url):
-        if config.debug:
-            print("%sprice: GET %s" % (Fore.YELLOW, url))
+        response = self.get_response(url)
+
+        if response:
+            return response.json()
+        return {}
+
+    def get_asset_list(self, url):
+        # The list of assets is cached, it's only fetched again once it's older than the TTL.
+        #  Even then, if the data source supports it, the list is only downloaded if it's changed
+        asset_list = self.prices.get_asset_list(url)
+        if asset_list and time.time() - asset_list['fetched'] < config.data_source_list_ttl * 3600:
+            log.debug(Fore.YELLOW, "price: %s asset list loaded from cache", self.name())
+            return asset_list['data']
+
+        headers = {}
+        if asset_list:
+            if asset_list['etag']:
+                headers['If-None-Match'] = asset_list['etag']
+            if asset_list['last_modified']:
+                headers['If-Modified-Since'] = asset_list['last_modified']
 
-        response = requests.get(url, headers={'User-Agent': self.USER_AGENT}, timeout=self.TIME_OUT)
+        try:
+            response = self.get_response(url, headers)
+            if response.status_code == 304:
+                self.prices.touch_asset_list(url, time.time())
+                log.debug(Fore.YELLOW, "price: %s asset list not modified", self.name())
+                return asset_list['data']
+
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            if asset_list:
+                # Better to use the last list we had, than none at all
+                print("%sWARNING%s Asset list for %s could not be updated, using cached list" % (
+                    Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW, self.name()))
+                return asset_list['data']
+            raise
+
+        self.prices.update_asset_list(url, time.time(),
+                                      response.headers.get('ETag'),
+                                      response.headers.get('Last-Modified'),
+                                      data)
+        return data
+
+    def get_response(self, url, headers=None):
+        log.debug(Fore.YELLOW, "price: GET %s", url)
+
+        with self.rate_limiter:
+            response = self.session.get(url, headers=headers, timeout=self.time_out)
+
+        retries = getattr(response.raw, 'retries', None)
+        if retries and retries.history:
+            self.rate_limiter.add_rate_limited(
+                sum(1 for request in retries.history if request.status == 429))
 
         if response.status_code in [429, 502, 503, 504]:
             response.raise_for_status()
 
-        if response:
-            return response.json()
-        return {}
+        return response
 
     def update_prices(self, pair, prices, timestamp):
-        if pair not in self.prices:
-            self.prices[pair] = {}
-
         # We are not interested in today's latest price, only the days closing price, also need to
         #  filter any erroneous future dates returned
         prices = {k: v
@@ -69,32 +136,7 @@ class DataSourceBase(object):
             prices[date] = {'price': None,
                             'url': None}
 
-        self.prices[pair].update(prices)
-
-    def load_prices(self):
-        filename = os.path.join(config.CACHE_DIR, self.name() + '.json')
-        if not os.path.exists(filename):
-            return {}
-
-        try:
-            with open(filename, 'r') as price_cache:
-                json_prices = json.load(price_cache)
-                return {pair: {date: {'price': self.str_to_decimal(price['price']),
-                                      'url': price['url']}
-                               for date, price in json_prices[pair].items()}
-                        for pair in json_prices}
-        except:
-            print("%sWARNING%s Data cached for %s could not be loaded" % (
-                Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW, self.name()))
-            return {}
-
-    def dump_prices(self):
-        with open(os.path.join(config.CACHE_DIR, self.name() + '.json'), 'w') as price_cache:
-            json_prices = {pair: {date: {'price': self.decimal_to_str(price['price']),
-                                         'url': price['url']}
-                                  for date, price in self.prices[pair].items()}
-                           for pair in self.prices}
-            json.dump(json_prices, price_cache, indent=4, sort_keys=True)
+        self.prices.update(pair, prices)
 
     def get_config_assets(self):
         for symbol in config.data_source_select:
@@ -111,13 +153,12 @@ class DataSourceBase(object):
         if asset_id in self.ids and self.ids[asset_id]['symbol'] == symbol:
             self.assets[symbol] = {'id': asset_id, 'name': self.ids[asset_id]['name']}
 
-            if config.debug:
-                print("%sprice: %s updated as %s [ID:%s] (%s)" % (
-                    Fore.YELLOW,
-                    symbol,
-                    self.name(),
-                    asset_id,
-                    self.ids[asset_id]['name']))
+            log.debug(Fore.YELLOW, "price: %s updated as %s [ID:%s] (%s)",
+                      symbol,
+                      self.name(),
+                      asset_id,
+                      self.ids[asset_id]['name'],
+                      asset=symbol)
         else:
             raise UnexpectedDataSourceAssetIdError(data_source, symbol)
 
@@ -127,13 +168,12 @@ class DataSourceBase(object):
             self.assets[symbol] = {'id': asset_id, 'name': self.ids[asset_id]['name']}
             self.ids[asset_id] = {'symbol': symbol, 'name': self.ids[asset_id]['name']}
 
-            if config.debug:
-                print("%sprice: %s added as %s [ID:%s] (%s)" % (
-                    Fore.YELLOW,
-                    symbol,
-                    self.name(),
-                    asset_id,
-                    self.ids[asset_id]['name']))
+            log.debug(Fore.YELLOW, "price: %s added as %s [ID:%s] (%s)",
+                      symbol,
+                      self.name(),
+                      asset_id,
+                      self.ids[asset_id]['name'],
+                      asset=symbol)
         else:
             raise UnexpectedDataSourceAssetIdError(data_source, symbol)
 
@@ -159,20 +199,6 @@ class DataSourceBase(object):
     def pair(asset, quote):
         return asset + '/' + quote
 
-    @staticmethod
-    def str_to_decimal(price):
-        if price:
-            return Decimal(price)
-
-        return None
-
-    @staticmethod
-    def decimal_to_str(price):
-        if price:
-            return '{0:f}'.format(price)
-
-        return None
-
     @staticmethod
     def epoch_time(timestamp):
         epoch = (timestamp - datetime(1970, 1, 1, tzinfo=config.TZ_UTC)).total_seconds()
@@ -181,7 +207,7 @@ class DataSourceBase(object):
 class BittyTaxAPI(DataSourceBase):
     def __init__(self):
         super(BittyTaxAPI, self).__init__()
-        json_resp = self.get_json("https://api.bitty.tax/v1/symbols")
+        json_resp = self.get_asset_list("https://api.bitty.tax/v1/symbols")
         self.assets = {k: {'name': v}
                        for k, v in json_resp['symbols'].items()}
 
@@ -261,9 +287,11 @@ class CoinDesk(DataSourceBase):
                                timestamp)
 
 class CryptoCompare(DataSourceBase):
+    RATE_LIMIT = (50, 1)
+
     def __init__(self):
         super(CryptoCompare, self).__init__()
-        json_resp = self.get_json("https://min-api.cryptocompare.com/data/all/coinlist")
+        json_resp = self.get_asset_list("https://min-api.cryptocompare.com/data/all/coinlist")
         self.assets = {c[1]['Symbol'].strip().upper(): {'name': c[1]['CoinName'].strip()}
                        for c in json_resp['Data'].items()}
         # CryptoCompare symbols are unique, so no ID required
@@ -291,9 +319,11 @@ class CryptoCompare(DataSourceBase):
                                timestamp)
 
 class CoinGecko(DataSourceBase):
+    RATE_LIMIT = (50, 60)
+
     def __init__(self):
         super(CoinGecko, self).__init__()
-        json_resp = self.get_json("https://api.coingecko.com/api/v3/coins/list")
+        json_resp = self.get_asset_list("https://api.coingecko.com/api/v3/coins/list")
         self.ids = {c['id']: {'symbol': c['symbol'].strip().upper(), 'name': c['name'].strip()}
                     for c in json_resp}
         self.assets = {c['symbol'].strip().upper(): {'id': c['id'], 'name': c['name'].strip()}
@@ -326,9 +356,11 @@ class CoinGecko(DataSourceBase):
                                timestamp)
 
 class CoinPaprika(DataSourceBase):
+    RATE_LIMIT = (10, 1)
+
     def __init__(self):
         super(CoinPaprika, self).__init__()
-        json_resp = self.get_json("https://api.coinpaprika.com/v1/coins")
+        json_resp = self.get_asset_list("https://api.coinpaprika.com/v1/coins")
         self.ids = {c['id']: {'symbol': c['symbol'].strip().upper(), 'name': c['name'].strip()}
                     for c in json_resp}
         self.assets = {c['symbol'].strip().upper(): {'id': c['id'], 'name': c['name'].strip()}
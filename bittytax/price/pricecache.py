@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import os
+import json
+import sqlite3
+import threading
+from decimal import Decimal
+
+from colorama import Fore, Back
+
+from ..config import config
+from ..log import get_log
+
+log = get_log('price')
+
+class PriceCache(object):
+    # Historic prices for a data source, held in a database shared by all the data sources.
+    #  The prices for a pair are only read when it's first used, and new prices are inserted
+    #  as they are fetched, rather than the whole cache being written out at exit. Prices can
+    #  be fetched by more than one thread, so the connection is shared under a lock. The lists
+    #  of assets supported by the data source are also kept here, with when they were fetched
+    FILENAME = 'Prices.db'
+    TIME_OUT = 30
+
+    def __init__(self, data_source):
+        self.data_source = data_source
+        self.pairs = {}
+        self.lock = threading.RLock()
+
+        if not os.path.exists(config.CACHE_DIR):
+            os.mkdir(config.CACHE_DIR)
+
+        self.connection = sqlite3.connect(os.path.join(config.CACHE_DIR, self.FILENAME),
+                                          timeout=self.TIME_OUT,
+                                          check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS prices ("
+                                "data_source TEXT NOT NULL, "
+                                "pair TEXT NOT NULL, "
+                                "date TEXT NOT NULL, "
+                                "price TEXT, "
+                                "url TEXT, "
+                                "PRIMARY KEY (data_source, pair, date))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS asset_lists ("
+                                "data_source TEXT NOT NULL, "
+                                "url TEXT NOT NULL, "
+                                "fetched REAL NOT NULL, "
+                                "etag TEXT, "
+                                "last_modified TEXT, "
+                                "data TEXT NOT NULL, "
+                                "PRIMARY KEY (data_source, url))")
+        self.connection.commit()
+
+        self.migrate_json()
+
+    def __contains__(self, pair):
+        return bool(self[pair])
+
+    def __getitem__(self, pair):
+        with self.lock:
+            if pair not in self.pairs:
+                self.pairs[pair] = {date: {'price': str_to_decimal(price), 'url': url}
+                                    for date, price, url in self.connection.execute(
+                                        "SELECT date, price, url FROM prices "
+                                        "WHERE data_source = ? AND pair = ?",
+                                        (self.data_source, pair))}
+
+                if self.pairs[pair]:
+                    log.debug(Fore.YELLOW, "price: %s (%s) data cache loaded",
+                              self.data_source, pair)
+
+            return self.pairs[pair]
+
+    def no_data(self, pair, date):
+        # Nothing was returned for this date, so it's not asked for again. It's only held in
+        #  memory, the date is tried again the next time it's run
+        with self.lock:
+            if date not in self[pair]:
+                self[pair][date] = {'price': None, 'url': None}
+
+    def update(self, pair, prices):
+        with self.lock:
+            self[pair].update(prices)
+            self.insert([(self.data_source, pair, date, decimal_to_str(price['price']),
+                          price['url']) for date, price in prices.items()])
+
+    def insert(self, rows):
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO prices "
+                                        "(data_source, pair, date, price, url) "
+                                        "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def get_asset_list(self, url):
+        with self.lock:
+            row = self.connection.execute("SELECT fetched, etag, last_modified, data "
+                                          "FROM asset_lists WHERE data_source = ? AND url = ?",
+                                          (self.data_source, url)).fetchone()
+        if row is None:
+            return None
+
+        fetched, etag, last_modified, data = row
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return None
+
+        return {'fetched': fetched, 'etag': etag, 'last_modified': last_modified, 'data': data}
+
+    def update_asset_list(self, url, fetched, etag, last_modified, data):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO asset_lists "
+                                    "(data_source, url, fetched, etag, last_modified, data) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)",
+                                    (self.data_source, url, fetched, etag, last_modified,
+                                     json.dumps(data)))
+
+    def touch_asset_list(self, url, fetched):
+        # The data source says the list hasn't changed, so it's good for another TTL
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE asset_lists SET fetched = ? "
+                                    "WHERE data_source = ? AND url = ?",
+                                    (fetched, self.data_source, url))
+
+    def migrate_json(self):
+        # Prices cached by earlier versions are moved into the database the first time, the
+        #  file is then renamed so it's not migrated again
+        filename = os.path.join(config.CACHE_DIR, self.data_source + '.json')
+        if not os.path.exists(filename):
+            return
+
+        try:
+            with open(filename, 'r') as price_cache:
+                json_prices = json.load(price_cache)
+
+            self.insert([(self.data_source, pair, date, price['price'], price['url'])
+                         for pair in json_prices
+                         for date, price in json_prices[pair].items()])
+
+            os.rename(filename, filename + '.migrated')
+        except:
+            print("%sWARNING%s Data cached for %s could not be migrated" % (
+                Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW, self.data_source))
+            return
+
+        log.debug(Fore.YELLOW, "price: %s data cache migrated from \"%s\"",
+                  self.data_source, filename)
+
+def str_to_decimal(price):
+    if price:
+        return Decimal(price)
+
+    return None
+
+def decimal_to_str(price):
+    if price:
+        return '{0:f}'.format(price)
+
+    return None
@@ -2,15 +2,23 @@
 # (c) Nano Nano Ltd 2019
 
 import os
+from multiprocessing.pool import ThreadPool
 
-from colorama import Fore
+from colorama import Fore, Back
+from tqdm import tqdm
 
 from ..version import __version__
 from ..config import config
+from ..progress import progress
+from ..log import get_log
 from .datasource import DataSourceBase
 from .exceptions import UnexpectedDataSourceError
 
+log = get_log('price')
+
 class PriceData(object):
+    PREFETCH_THREADS = 8
+
     def __init__(self, data_sources_required, price_tool=False):
         self.price_tool = price_tool
         self.data_sources = {}
@@ -53,7 +61,8 @@ class PriceData(object):
                               self.data_sources[data_source.upper()].assets[asset]['name'], \
                               self.data_sources[data_source.upper()].prices[pair][date]['url']
 
-                self.data_sources[data_source.upper()].get_historical(asset, quote, timestamp)
+                self._fetch_historical(self.data_sources[data_source.upper()],
+                                       asset, quote, timestamp)
                 if pair in self.data_sources[data_source.upper()].prices and \
                    date in self.data_sources[data_source.upper()].prices[pair]:
                     return self.data_sources[data_source.upper()].prices[pair][date]['price'], \
@@ -63,19 +72,87 @@ class PriceData(object):
             return None, None, None
         raise UnexpectedDataSourceError(data_source, DataSourceBase)
 
+    def prefetch_historical(self, pairs):
+        # Any prices missing from the cache are fetched for each pair from its preferred data
+        #  source. The pairs are fetched concurrently, but the dates for a pair are fetched in
+        #  order, as a single request can return the prices for many days
+        fetches = []
+        for asset, quote in sorted(pairs):
+            for data_source in self.data_source_priority(asset):
+                if data_source.upper() in self.data_sources and \
+                        asset in self.data_sources[data_source.upper()].assets:
+                    prices = self.data_sources[data_source.upper()].prices[asset + '/' + quote]
+                    timestamps = [pairs[(asset, quote)][date]
+                                  for date in sorted(pairs[(asset, quote)]) if date not in prices]
+                    if timestamps:
+                        fetches.append((self.data_sources[data_source.upper()], asset, quote,
+                                        timestamps))
+                    break
+
+        if not fetches:
+            return
+
+        pool = ThreadPool(min(self.PREFETCH_THREADS, len(fetches)))
+        try:
+            for _ in progress(pool.imap_unordered(self._prefetch_pair, fetches),
+                              "prefetch prices", unit=' pair', total=len(fetches)):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+
+        for data_source in sorted({fetch[0] for fetch in fetches}, key=lambda ds: ds.name()):
+            metrics = data_source.rate_limiter.metrics()
+            log.debug(Fore.YELLOW, "price: %s requests=%d, throttled=%d (%.1fs), "
+                                   "rate limited=%d",
+                      data_source.name(),
+                      metrics['requests'],
+                      metrics['throttled'],
+                      metrics['wait_time'],
+                      metrics['rate_limited'])
+
+    @staticmethod
+    def _prefetch_pair(fetch):
+        data_source, asset, quote, timestamps = fetch
+        prices = data_source.prices[asset + '/' + quote]
+
+        for timestamp in timestamps:
+            if timestamp.strftime('%Y-%m-%d') in prices:
+                # Already returned with an earlier date
+                continue
+
+            try:
+                PriceData._fetch_historical(data_source, asset, quote, timestamp)
+            except Exception as e: # pylint: disable=broad-except
+                # Only this date is skipped, it's not requested again when it's valued
+                tqdm.write("%sWARNING%s Price for %s/%s on %s could not be fetched from %s, %s" % (
+                    Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW,
+                    asset, quote, timestamp.strftime('%Y-%m-%d'), data_source.name(), e))
+                continue
+
+    @staticmethod
+    def _fetch_historical(data_source, asset, quote, timestamp):
+        # If no price is returned for the date, or the request fails, it's marked as having no
+        #  data so the same request isn't made again
+        try:
+            data_source.get_historical(asset, quote, timestamp)
+        finally:
+            data_source.prices.no_data(data_source.pair(asset, quote),
+                                       timestamp.strftime('%Y-%m-%d'))
+
     def get_latest(self, asset, quote):
         name = None
         for data_source in self.data_source_priority(asset):
             price, name = self.get_latest_ds(data_source, asset, quote)
             if price is not None:
-                if config.debug:
-                    print("%sprice: <latest>, 1 %s=%s %s via %s (%s)" % (
-                        Fore.YELLOW,
-                        asset,
-                        '{:0,f}'.format(price.normalize()),
-                        quote,
-                        self.data_sources[data_source.upper()].name(),
-                        name))
+                if log.is_debug(asset):
+                    log.debug(Fore.YELLOW, "price: <latest>, 1 %s=%s %s via %s (%s)",
+                              asset,
+                              '{:0,f}'.format(price.normalize()),
+                              quote,
+                              self.data_sources[data_source.upper()].name(),
+                              name,
+                              asset=asset)
                 if self.price_tool:
                     print("%s1 %s=%s %s %svia %s (%s)" % (
                         Fore.YELLOW,
@@ -94,15 +171,15 @@ class PriceData(object):
             price, name, url = self.get_historical_ds(data_source, asset, quote, timestamp,
                                                       no_cache)
             if price is not None:
-                if config.debug:
-                    print("%sprice: %s, 1 %s=%s %s via %s (%s)" % (
-                        Fore.YELLOW,
-                        timestamp.strftime('%Y-%m-%d'),
-                        asset,
-                        '{:0,f}'.format(price.normalize()),
-                        quote,
-                        self.data_sources[data_source.upper()].name(),
-                        name))
+                if log.is_debug(asset):
+                    log.debug(Fore.YELLOW, "price: %s, 1 %s=%s %s via %s (%s)",
+                              timestamp.strftime('%Y-%m-%d'),
+                              asset,
+                              '{:0,f}'.format(price.normalize()),
+                              quote,
+                              self.data_sources[data_source.upper()].name(),
+                              name,
+                              asset=asset)
                 if self.price_tool:
                     print("%s1 %s=%s %s %svia %s (%s)" % (
                         Fore.YELLOW,
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import sys
+import time
+import threading
+
+if sys.version_info[:2] >= (3, 3):
+    wall_clock = time.monotonic
+else:
+    wall_clock = time.time
+
+class RateLimiter(object):
+    # Token bucket for the requests to a data source, a burst of up to the limit is allowed,
+    #  after which requests are paced to the rate. Requests from concurrent workers wait their
+    #  turn for a token, with no limit they go straight through
+    def __init__(self, requests=None, seconds=None):
+        self.capacity = requests
+        self.rate = float(requests) / seconds if requests and seconds else None
+        self.tokens = float(requests or 0)
+        self.updated = wall_clock()
+        self.condition = threading.Condition()
+
+        self.requests = 0
+        self.queued = 0
+        self.in_flight = 0
+        self.throttled = 0
+        self.rate_limited = 0
+        self.wait_time = 0.0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self.condition:
+            self.in_flight -= 1
+
+        return False
+
+    def acquire(self):
+        with self.condition:
+            self.requests += 1
+
+            if self.rate:
+                self.queued += 1
+                start_time = None
+                try:
+                    while not self._take_token():
+                        if start_time is None:
+                            start_time = wall_clock()
+                            self.throttled += 1
+
+                        self.condition.wait((1 - self.tokens) / self.rate)
+                finally:
+                    self.queued -= 1
+
+                if start_time is not None:
+                    self.wait_time += wall_clock() - start_time
+
+            self.in_flight += 1
+
+    def _take_token(self):
+        now = wall_clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def add_rate_limited(self, count):
+        # Responses from the data source saying it's rate limited (HTTP 429), even if retried
+        with self.condition:
+            self.rate_limited += count
+
+    def metrics(self):
+        with self.condition:
+            return {'requests': self.requests,
+                    'queued': self.queued,
+                    'in_flight': self.in_flight,
+                    'throttled': self.throttled,
+                    'rate_limited': self.rate_limited,
+                    'wait_time': self.wait_time}
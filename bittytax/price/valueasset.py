@@ -9,8 +9,11 @@ from tqdm import tqdm
 
 from ..version import __version__
 from ..config import config
+from ..log import get_log
 from .pricedata import PriceData
 
+log = get_log('price')
+
 class ValueAsset(object):
     def __init__(self, price_tool=False):
         self.price_tool = price_tool
@@ -31,19 +34,19 @@ class ValueAsset(object):
         asset_price_ccy, _, _ = self.get_historical_price(asset, timestamp)
         if asset_price_ccy is not None:
             value = asset_price_ccy * quantity
-            if config.debug:
-                print("%sprice: %s, 1 %s=%s %s, %s %s=%s%s %s%s" % (
-                    Fore.YELLOW,
-                    timestamp.strftime('%Y-%m-%d'),
-                    asset,
-                    config.sym() + '{:0,.2f}'.format(asset_price_ccy),
-                    config.ccy,
-                    '{:0,f}'.format(quantity.normalize()),
-                    asset,
-                    Style.BRIGHT,
-                    config.sym() + '{:0,.2f}'.format(value),
-                    config.ccy,
-                    Style.NORMAL))
+            if log.is_debug(asset):
+                log.debug(Fore.YELLOW, "price: %s, 1 %s=%s %s, %s %s=%s%s %s%s",
+                          timestamp.strftime('%Y-%m-%d'),
+                          asset,
+                          config.sym() + '{:0,.2f}'.format(asset_price_ccy),
+                          config.ccy,
+                          '{:0,f}'.format(quantity.normalize()),
+                          asset,
+                          Style.BRIGHT,
+                          config.sym() + '{:0,.2f}'.format(value),
+                          config.ccy,
+                          Style.NORMAL,
+                          asset=asset)
             return value, False
 
         tqdm.write("%sWARNING%s Price for %s on %s is not available, using price of %s" % (
@@ -91,6 +94,31 @@ class ValueAsset(object):
 
         return asset_price_ccy, name, data_source
 
+    def prefetch_historical_prices(self, lookups):
+        # Fetch the prices for the same pairs get_historical_price will use, before they are
+        #  needed, so they come from the cache
+        pairs = {}
+        today = datetime.now().date()
+
+        for asset, timestamp in lookups:
+            if timestamp.date() >= today:
+                continue
+
+            if asset == 'BTC' or asset in config.fiat_list:
+                asset_pairs = [(asset, config.ccy)]
+            else:
+                asset_pairs = [(asset, 'BTC'), ('BTC', config.ccy)]
+
+            date = timestamp.strftime('%Y-%m-%d')
+            for pair in asset_pairs:
+                if pair not in pairs:
+                    pairs[pair] = {}
+
+                if date not in pairs[pair]:
+                    pairs[pair][date] = timestamp
+
+        self.price_data.prefetch_historical(pairs)
+
     def get_latest_price(self, asset):
         asset_price_ccy = None
 
@@ -108,11 +136,7 @@ class ValueAsset(object):
 
     def price_report_cache(self, asset, timestamp, name, data_source, url,
                            price_ccy, price_btc=None):
-        if timestamp > config.get_tax_year_end(timestamp.year):
-            tax_year = timestamp.year + 1
-        else:
-            tax_year = timestamp.year
-
+        tax_year = config.get_tax_year(timestamp)
         if tax_year not in self.price_report:
             self.price_report[tax_year] = {}
 
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import os
+import re
+import sys
+import time
+import json
+import platform
+import cProfile
+
+from colorama import Fore
+
+from .version import __version__
+
+if sys.version_info[:2] >= (3, 4):
+    import tracemalloc
+else:
+    tracemalloc = None
+
+if sys.version_info[:2] >= (3, 3):
+    wall_clock = time.perf_counter
+    cpu_clock = time.process_time
+else:
+    wall_clock = time.time
+    cpu_clock = time.clock
+
+class Profiler(object):
+    # Wall time, CPU time, peak memory and item counts for each stage of processing
+    def __init__(self):
+        self.enabled = False
+        self.stats_dir = None
+        self.active = None
+        self.stages = {}
+        self.cprofiles = {}
+
+    def enable(self, stats_dir=None, trace_memory=True):
+        self.enabled = True
+        self.stats_dir = stats_dir
+
+        if trace_memory and tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        if self.enabled and tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        self.enabled = False
+
+    def reset(self):
+        self.stages = {}
+        self.cprofiles = {}
+
+    def stage(self, name, count=None):
+        return ProfileStage(self, name, count)
+
+    def start(self, stage):
+        if tracemalloc and tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        if self.stats_dir:
+            if stage.name not in self.cprofiles:
+                self.cprofiles[stage.name] = cProfile.Profile()
+            self.cprofiles[stage.name].enable()
+
+        stage.wall_time = wall_clock()
+        stage.cpu_time = cpu_clock()
+
+    def stop(self, stage):
+        wall_time = wall_clock() - stage.wall_time
+        cpu_time = cpu_clock() - stage.cpu_time
+
+        if self.stats_dir:
+            self.cprofiles[stage.name].disable()
+
+        if stage.name not in self.stages:
+            self.stages[stage.name] = {'order': len(self.stages),
+                                       'calls': 0,
+                                       'count': None,
+                                       'wall_time': 0.0,
+                                       'cpu_time': 0.0,
+                                       'peak_memory': None}
+
+        result = self.stages[stage.name]
+        result['calls'] += 1
+        result['wall_time'] += wall_time
+        result['cpu_time'] += cpu_time
+
+        if stage.count is not None:
+            result['count'] = (result['count'] or 0) + stage.count
+
+        if tracemalloc and tracemalloc.is_tracing():
+            # Before Python 3.9 the peak can't be reset, so it's the peak so far
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            result['peak_memory'] = max(result['peak_memory'] or 0, peak_memory)
+
+    def results(self):
+        return [dict(name=name, **{k: v for k, v in self.stages[name].items() if k != 'order'})
+                for name in sorted(self.stages, key=lambda name: self.stages[name]['order'])]
+
+    def output(self, stream=None):
+        if stream is None:
+            stream = sys.stdout
+
+        header = "%-32s %12s %6s %12s %12s %14s" % ('Stage',
+                                                    'Count',
+                                                    'Calls',
+                                                    'Wall Time',
+                                                    'CPU Time',
+                                                    'Peak Memory')
+
+        stream.write("%sprofile:\n" % Fore.CYAN)
+        stream.write("%s%s\n" % (Fore.YELLOW, header))
+        for result in self.results():
+            stream.write("%s%-32s %12s %6d %11.3fs %11.3fs %14s\n" % (
+                Fore.WHITE,
+                result['name'],
+                '{:0,d}'.format(result['count']) if result['count'] is not None else '',
+                result['calls'],
+                result['wall_time'],
+                result['cpu_time'],
+                '{:0,.1f} MB'.format(result['peak_memory'] / 1024.0 / 1024.0)
+                if result['peak_memory'] is not None else 'n/a'))
+
+    def write_json(self, filename, prog):
+        with open(filename, 'w') as json_file:
+            json.dump({'tool': prog,
+                       'version': __version__,
+                       'python': platform.python_version(),
+                       'stages': self.results()},
+                      json_file, indent=4)
+
+    def write_stats(self):
+        if not self.stats_dir:
+            return
+
+        if not os.path.exists(self.stats_dir):
+            os.makedirs(self.stats_dir)
+
+        for name in self.cprofiles:
+            self.cprofiles[name].dump_stats(os.path.join(self.stats_dir, '%s.prof' %
+                                                         re.sub(r'\W+', '_', name)))
+
+class ProfileStage(object):
+    def __init__(self, profiler, name, count):
+        self.profiler = profiler
+        self.name = name
+        self.count = count
+        self.recording = False
+        self.wall_time = None
+        self.cpu_time = None
+
+    def __enter__(self):
+        # A stage within one already being profiled is included in that one
+        if self.profiler.enabled and not self.profiler.active:
+            self.profiler.active = self
+            self.recording = True
+            self.profiler.start(self)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.recording:
+            self.profiler.stop(self)
+            self.profiler.active = None
+            self.recording = False
+
+        return False
+
+profiler = Profiler()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import sys
+import json
+import time
+from itertools import islice
+
+from colorama import Fore
+from tqdm import tqdm
+
+from .config import config
+
+if sys.version_info[:2] >= (3, 3):
+    wall_clock = time.perf_counter
+else:
+    wall_clock = time.time
+
+class Progress(object):
+    # Progress of long running loops. The bar is only updated after each batch of items, the
+    #  batch size adapts so there is an update about every interval, however fast or slow the
+    #  items are. When there is nothing to show, the items are iterated over directly
+    INTERVAL = 0.1
+    MAX_BATCH = 10000
+
+    def __init__(self):
+        self.stream = None
+
+    def set_stream(self, stream):
+        # Progress is also written to the stream as JSON lines, for other programs to read
+        self.stream = stream
+
+    def __call__(self, iterable, desc, unit, total=None):
+        show_bar = not config.debug and sys.stdout.isatty()
+
+        if not show_bar and not self.stream:
+            return iterable
+
+        if total is None and hasattr(iterable, '__len__'):
+            total = len(iterable)
+
+        return self._iterate(iterable, desc, unit, total, show_bar)
+
+    def _iterate(self, iterable, desc, unit, total, show_bar):
+        pbar = tqdm(total=total,
+                    unit=unit,
+                    desc="%s%s%s" % (Fore.CYAN, desc, Fore.GREEN),
+                    disable=not show_bar)
+        start_time = last_time = wall_clock()
+        iterator = iter(iterable)
+        batch = 1
+        n = 0
+
+        self._write_stream(desc, unit, n, total, 0.0)
+        try:
+            while True:
+                batch_time = wall_clock()
+                count = 0
+                for count, item in enumerate(islice(iterator, batch), 1):
+                    yield item
+
+                n += count
+                if count < batch:
+                    break
+
+                now = wall_clock()
+                if now - last_time >= self.INTERVAL:
+                    pbar.update(n - pbar.n)
+                    self._write_stream(desc, unit, n, total, now - start_time)
+                    last_time = now
+
+                if now > batch_time:
+                    batch = int(batch * self.INTERVAL / (now - batch_time))
+                    batch = min(max(batch, 1), self.MAX_BATCH)
+                else:
+                    batch = min(batch * 2, self.MAX_BATCH)
+        finally:
+            pbar.update(n - pbar.n)
+            pbar.close()
+            self._write_stream(desc, unit, n, total, wall_clock() - start_time, done=True)
+
+    def _write_stream(self, desc, unit, n, total, elapsed, done=False):
+        if not self.stream:
+            return
+
+        self.stream.write(json.dumps({'stage': desc,
+                                      'unit': unit.strip(),
+                                      'n': n,
+                                      'total': total,
+                                      'elapsed': round(elapsed, 3),
+                                      'done': done}) + '\n')
+        self.stream.flush()
+
+progress = Progress()
@@ -40,6 +40,8 @@ class TransactionRecord(object):
 
     cnt = 0
 
+    __slots__ = ('tid', 't_type', 'buy', 'sell', 'fee', 'wallet', 'timestamp', 'note')
+
     def __init__(self, t_type, buy, sell, fee, wallet, timestamp, note):
         self.tid = None
         self.t_type = t_type
@@ -50,21 +52,21 @@ class TransactionRecord(object):
         self.timestamp = timestamp
         self.note = note
 
-        if self.buy:
-            self.buy.t_record = self
-            self.buy.timestamp = self.timestamp.astimezone(config.TZ_LOCAL)
-            self.buy.wallet = self.wallet
-            self.buy.note = self.note
-        if self.sell:
-            self.sell.t_record = self
-            self.sell.timestamp = self.timestamp.astimezone(config.TZ_LOCAL)
-            self.sell.wallet = self.wallet
-            self.sell.note = self.note
-        if self.fee:
-            self.fee.t_record = self
-            self.fee.timestamp = self.timestamp.astimezone(config.TZ_LOCAL)
-            self.fee.wallet = self.wallet
-            self.fee.note = self.note
+        # Local time and day are worked out once, they are used for all the matching, pooling
+        #  and tax year lookups
+        timestamp = self.timestamp.astimezone(config.TZ_LOCAL)
+        day = timestamp.toordinal()
+
+        for t in (self.buy, self.sell, self.fee):
+            if t:
+                t.t_record = self
+                t.timestamp = timestamp
+                t.day = day
+                t.wallet = self.wallet
+                t.note = self.note
+
+    def assets(self):
+        return tuple(t.asset for t in (self.buy, self.sell, self.fee) if t)
 
     def set_tid(self):
         if self.tid is None:
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import os
+import json
+from decimal import Decimal
+from datetime import datetime
+
+from colorama import Fore, Back
+import dateutil.tz
+
+from .config import config
+from .holdings import Holdings
+from .tax import TaxEventCapitalGains
+from .log import get_log
+
+log = get_log('snapshots')
+resume_log = get_log('resume')
+
+class Section104Snapshots(object):
+    # Section 104 holdings and disposals for each asset at the end of each tax year, persisted
+    #  between runs
+    def __init__(self, tax_rules):
+        self.filename = os.path.join(config.CACHE_DIR, 'Section104_%s.json' % tax_rules)
+
+        if not os.path.exists(config.CACHE_DIR):
+            os.mkdir(config.CACHE_DIR)
+
+        self.snapshots = self.load()
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return {}
+
+        try:
+            with open(self.filename, 'r') as snapshot_cache:
+                # Only converted when resumed from
+                json_snapshots = json.load(snapshot_cache)
+                return {int(tax_year): json_snapshots[tax_year] for tax_year in json_snapshots}
+        except (IOError, OSError, ValueError) as e:
+            print("%sWARNING%s Section 104 snapshots could not be loaded" % (
+                Back.YELLOW+Fore.BLACK, Back.RESET+Fore.YELLOW))
+            resume_log.debug(Fore.GREEN, "resume: snapshots in \"%s\" discarded, %s",
+                             self.filename, e)
+            return {}
+
+    def dump(self, snapshots, keys):
+        for tax_year in snapshots:
+            for asset in snapshots[tax_year]:
+                if tax_year not in keys.get(asset, {}):
+                    continue
+
+                if tax_year not in self.snapshots:
+                    self.snapshots[tax_year] = {}
+
+                self.snapshots[tax_year][asset] = self.to_json(snapshots[tax_year][asset],
+                                                               keys[asset][tax_year])
+
+        with open(self.filename, 'w') as snapshot_cache:
+            json.dump({str(tax_year): self.snapshots[tax_year] for tax_year in self.snapshots},
+                      snapshot_cache, indent=4, sort_keys=True)
+
+        log.debug(Fore.GREEN, "snapshots: saved to \"%s\"", self.filename)
+
+    def key(self, tax_year, asset):
+        if tax_year in self.snapshots and asset in self.snapshots[tax_year]:
+            return self.snapshots[tax_year][asset]['key']
+        return None
+
+    def get(self, tax_year, asset):
+        return self.from_json(asset, self.snapshots[tax_year][asset])
+
+    @staticmethod
+    def to_json(snapshot, key):
+        holdings = snapshot['holdings']
+        return {'key': key,
+                'holdings': {'quantity': str(holdings.quantity),
+                             'cost': str(holdings.cost),
+                             'fees': str(holdings.fees),
+                             'withdrawals': holdings.withdrawals,
+                             'deposits': holdings.deposits,
+                             'mismatches': holdings.mismatches},
+                'matched': {str(day): [str(quantity) for quantity in quantities]
+                            for day, quantities in snapshot['matched'].items()},
+                'tax_events': [tax_event_to_json(te) for te in snapshot['tax_events']],
+                'disposals': [tax_event_to_json(te) for te in snapshot['disposals']]}
+
+    @staticmethod
+    def from_json(asset, json_snapshot):
+        holdings = Holdings(asset)
+        holdings.quantity = Decimal(json_snapshot['holdings']['quantity'])
+        holdings.cost = Decimal(json_snapshot['holdings']['cost'])
+        holdings.fees = Decimal(json_snapshot['holdings']['fees'])
+        holdings.withdrawals = json_snapshot['holdings']['withdrawals']
+        holdings.deposits = json_snapshot['holdings']['deposits']
+        holdings.mismatches = json_snapshot['holdings']['mismatches']
+
+        return {'key': json_snapshot['key'],
+                'holdings': holdings,
+                'matched': {int(day): [Decimal(quantity) for quantity in quantities]
+                            for day, quantities in json_snapshot['matched'].items()},
+                'tax_events': [tax_event_from_json(asset, json_te)
+                               for json_te in json_snapshot['tax_events']],
+                'disposals': [tax_event_from_json(asset, json_te)
+                              for json_te in json_snapshot['disposals']]}
+
+def tax_event_to_json(te):
+    return {'date': format_date(te.date),
+            'disposal_type': te.disposal_type,
+            'quantity': str(te.quantity),
+            'cost': str(te.cost),
+            'fees': str(te.fees),
+            'proceeds': str(te.proceeds),
+            'gain': str(te.gain),
+            'acquisition_date': format_date(te.acquisition_date) if te.acquisition_date else None}
+
+def tax_event_from_json(asset, json_te):
+    # Disposal is recreated as it was, not from the buy and sell it was matched from
+    te = TaxEventCapitalGains.__new__(TaxEventCapitalGains)
+    te.date = parse_date(json_te['date'])
+    te.asset = asset
+    te.disposal_type = json_te['disposal_type']
+    te.quantity = Decimal(json_te['quantity'])
+    te.cost = Decimal(json_te['cost'])
+    te.fees = Decimal(json_te['fees'])
+    te.proceeds = Decimal(json_te['proceeds'])
+    te.gain = Decimal(json_te['gain'])
+    te.acquisition_date = parse_date(json_te['acquisition_date']) \
+            if json_te['acquisition_date'] else None
+    return te
+
+def format_date(date):
+    # Local time, fold distinguishes the repeated hour when the clocks go back
+    return [date.year, date.month, date.day, date.hour, date.minute, date.second,
+            date.microsecond, getattr(date, 'fold', 0)]
+
+def parse_date(date):
+    if date[7]:
+        return dateutil.tz.enfold(datetime(*date[:7], tzinfo=config.TZ_LOCAL), fold=1)
+    return datetime(*date[:7], tzinfo=config.TZ_LOCAL)
@@ -2,19 +2,36 @@
 # (c) Nano Nano Ltd 2019
 
 import sys
+import io
 import copy
+import hashlib
+import heapq
+import multiprocessing
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import date
 
 from colorama import Fore
 from tqdm import tqdm
 
+from .version import __version__
 from .config import config
 from .transactions import Buy, Sell
 from .holdings import Holdings
+from .profiler import profiler
+from .progress import progress
+from .log import get_log
 
 PRECISION = Decimal('0.00')
 
+resume_log = get_log('resume')
+pool_log = get_log('pool')
+match_log = get_log('match')
+section104_log = get_log('section104')
+income_log = get_log('income')
+holdings_log = get_log('holdings')
+
 class TaxCalculator(object):
     DISPOSAL_SAME_DAY = 'Same Day'
     DISPOSAL_TEN_DAY = 'Ten Day'
@@ -24,248 +41,526 @@ class TaxCalculator(object):
 
     TRANSFER_TYPES = (Buy.TYPE_DEPOSIT, Sell.TYPE_WITHDRAWAL)
 
-    INCOME_TYPES = (Buy.TYPE_MINING, Buy.TYPE_STAKING, Buy.TYPE_DIVIDEND, Buy.TYPE_INTEREST,
-                    Buy.TYPE_INCOME)
+    INCOME_TYPES = Buy.INCOME_TYPES
 
     NO_GAIN_NO_LOSS_TYPES = (Sell.TYPE_GIFT_SPOUSE, Sell.TYPE_CHARITY_SENT)
 
     # These transactions are except from the "same day" & "bnb" rule
     NO_MATCH_TYPES = (Sell.TYPE_GIFT_SPOUSE, Sell.TYPE_CHARITY_SENT, Sell.TYPE_LOST)
 
-    def __init__(self, transactions, tax_rules):
+    # Order in which the disposals are created, used when merging results from each asset
+    DISPOSAL_STAGE = {DISPOSAL_SAME_DAY: 0,
+                      DISPOSAL_TEN_DAY: 1,
+                      DISPOSAL_BED_AND_BREAKFAST: 1,
+                      DISPOSAL_SECTION_104: 2,
+                      DISPOSAL_NO_GAIN_NO_LOSS: 2}
+
+    def __init__(self, transactions, tax_rules, income_transactions=None):
         self.transactions = transactions
+        # Income is picked out when the records are split, otherwise all are searched
+        self.income_transactions = income_transactions
         self.tax_rules = tax_rules
-        self.buys_ordered = []
-        self.sells_ordered = []
-        self.other_transactions = []
+        self.buys = PooledTransactions()
+        self.sells = PooledTransactions()
+        self.other_transactions = {}
 
         self.tax_events = {}
         self.holdings = {}
 
+        # Section 104 snapshots recorded at each tax year end, and those resumed from
+        self.snapshots = {}
+        self.resumed = {}
+
         self.tax_report = {}
         self.holdings_report = {}
 
+    def process_disposals(self, skip_integrity_check):
+        for asset in sorted(self.resumed):
+            # Disposals from before the snapshot which fall after it
+            for te in self.resumed[asset][1]['tax_events']:
+                self.tax_events[self.which_tax_year(te.date)].append(copy.copy(te))
+
+        with profiler.stage('pool same day', len(self.transactions)):
+            self.pool_same_day()
+
+        with profiler.stage('match same day', len(self.sells)):
+            self.match_sell(self.DISPOSAL_SAME_DAY)
+
+        if self.tax_rules == config.TAX_RULES_UK_INDIVIDUAL:
+            with profiler.stage('match bed & breakfast', len(self.sells)):
+                self.match_buyback(self.DISPOSAL_BED_AND_BREAKFAST)
+        elif self.tax_rules in config.TAX_RULES_UK_COMPANY:
+            with profiler.stage('match ten day', len(self.sells)):
+                self.match_sell(self.DISPOSAL_TEN_DAY)
+
+        with profiler.stage('process section 104', len(self.transactions)):
+            self.process_section104(skip_integrity_check)
+
+        if self.resumed:
+            for tax_year in self.tax_events:
+                # Put any disposals from a snapshot back in the order they were made
+                self.tax_events[tax_year].sort(
+                    key=lambda te: (self.DISPOSAL_STAGE[te.disposal_type], te.asset))
+
+        self._snapshot_disposals()
+
+    def resume(self, snapshots, tax_year, skip_integrity_check):
+        # Resume each asset from its latest snapshot, providing none of the transactions it
+        #  depends upon have changed since it was taken. If all tax years are being calculated,
+        #  the disposals for the tax years up to the snapshot are reused
+        keys = self.snapshot_keys(skip_integrity_check)
+
+        for asset in sorted(keys):
+            years = []
+            for year in sorted(keys[asset]):
+                if tax_year and year >= tax_year:
+                    break
+
+                if snapshots.key(year, asset) != keys[asset][year]:
+                    if tax_year:
+                        continue
+                    break
+
+                years.append(year)
+
+            if years:
+                self.resumed[asset] = (years[-1], snapshots.get(years[-1], asset))
+                resume_log.debug(Fore.GREEN, "resume: %s from tax year %s",
+                                 asset, config.format_tax_year(years[-1]), asset=asset)
+
+                if not tax_year:
+                    for year in years:
+                        for te in snapshots.get(year, asset)['disposals']:
+                            self.tax_events[self.which_tax_year(te.date)].append(te)
+
+    def snapshot_keys(self, skip_integrity_check):
+        # Snapshot at the end of a tax year depends upon the transactions up to then, and those
+        #  after which are within the matching window, any other change invalidates it
+        days = max(abs(day) for day in self._rule_window(self._carry_rule(), 0, is_buy=True))
+        prefix = "%s|%s|%s|%s\n" % (__version__, self.tax_rules, config.transfers_include,
+                                    skip_integrity_check)
+        transactions = {}
+        for t in self.transactions:
+            if t.asset not in transactions:
+                transactions[t.asset] = []
+
+            transactions[t.asset].append(t)
+
+        keys = {}
+        for asset in transactions:
+            keys[asset] = {}
+            key = hashlib.sha1(prefix.encode('utf-8'))
+            tax_year = config.get_tax_year_of_day(transactions[asset][0].day)
+            last_tax_year = config.get_tax_year_of_day(transactions[asset][-1].day)
+            end_day = config.get_tax_year_days(tax_year)[1] + days
+
+            for t in transactions[asset]:
+                while t.day > end_day and tax_year <= last_tax_year:
+                    keys[asset][tax_year] = key.hexdigest()
+                    tax_year += 1
+                    end_day = config.get_tax_year_days(tax_year)[1] + days
+
+                key.update(self._snapshot_key(t).encode('utf-8'))
+
+            while tax_year <= last_tax_year:
+                keys[asset][tax_year] = key.hexdigest()
+                tax_year += 1
+
+        return keys
+
+    @staticmethod
+    def _snapshot_key(t):
+        if isinstance(t, Buy):
+            value, taxable = t.cost, t.acquisition
+        else:
+            value, taxable = t.proceeds, t.disposal
+
+        return "%s|%s|%s|%s|%s|%s|%s|%s|%s\n" % (type(t).__name__, t.t_type, t.asset,
+                                                 t.timestamp.replace(tzinfo=None).isoformat(),
+                                                 getattr(t.timestamp, 'fold', 0), t.quantity,
+                                                 value, t.fee_value, taxable)
+
+    def process_disposals_by_asset(self, jobs, skip_integrity_check):
+        # Each asset is independent, so can be processed in parallel
+        transactions = {}
+        for t in self.transactions:
+            if t.asset not in transactions:
+                transactions[t.asset] = []
+
+            transactions[t.asset].append(t)
+
+        assets = sorted(transactions)
+
+        if is_forked():
+            # Forked processes inherit the transactions, so they don't need to be pickled
+            ASSET_TRANSACTIONS.update(transactions)
+            args = [(asset, None, self.tax_rules, skip_integrity_check,
+                     self.resumed.get(asset)) for asset in assets]
+        else:
+            args = [(asset, transactions[asset], self.tax_rules, skip_integrity_check,
+                     self.resumed.get(asset)) for asset in assets]
+
+        pool = multiprocessing.Pool(jobs, init_process_asset,
+                                    (config.start_of_year_month, config.start_of_year_day))
+        try:
+            results = pool.imap(process_asset, args)
+
+            # Results are merged in asset order, the same order as if processed together
+            for asset in progress(assets, "process disposals", unit='a'):
+                tax_events, holdings, snapshots, output = next(results)
+                if output:
+                    tqdm.write(output, end='')
+
+                for tax_year in sorted(tax_events):
+                    if tax_year not in self.tax_events:
+                        self.tax_events[tax_year] = []
+
+                    self.tax_events[tax_year].extend(self._restore_tz(tax_events[tax_year]))
+
+                for tax_year in snapshots:
+                    if tax_year not in self.snapshots:
+                        self.snapshots[tax_year] = {}
+
+                    self._restore_tz(snapshots[tax_year][asset]['tax_events'])
+                    self._restore_tz(snapshots[tax_year][asset]['disposals'])
+                    self.snapshots[tax_year][asset] = snapshots[tax_year][asset]
+
+                self.holdings[asset] = holdings[asset]
+        finally:
+            pool.terminate()
+            ASSET_TRANSACTIONS.clear()
+
+        for tax_year in self.tax_events:
+            # Stable sort, keeps the order within each stage and asset
+            self.tax_events[tax_year].sort(
+                key=lambda te: (self.DISPOSAL_STAGE[te.disposal_type], te.asset))
+
+    @staticmethod
+    def _restore_tz(tax_events):
+        for te in tax_events:
+            # Timezone is a copy once unpickled, restore it so dates compare the same
+            te.date = te.date.replace(tzinfo=config.TZ_LOCAL)
+            if te.acquisition_date:
+                te.acquisition_date = te.acquisition_date.replace(tzinfo=config.TZ_LOCAL)
+
+        return tax_events
+
     def pool_same_day(self):
-        transactions = copy.deepcopy(self.transactions)
         buy_transactions = {}
         sell_transactions = {}
 
-        if config.debug:
-            print("%spool same day transactions" % Fore.CYAN)
+        pool_log.debug(Fore.CYAN, "pool same day transactions")
+
+        # The original transactions are left untouched (they are needed for income), only those
+        #  which are pooled, matched or have their values changed are copied
+        for t in progress(self.transactions, "pool same day", unit='t'):
+            if t.asset in self.resumed and \
+                    config.get_tax_year_of_day(t.day) <= self.resumed[t.asset][0]:
+                # Already included in the snapshot
+                continue
 
-        for t in tqdm(transactions,
-                      unit='t',
-                      desc="%spool same day%s" % (Fore.CYAN, Fore.GREEN),
-                      disable=bool(config.debug or not sys.stdout.isatty())):
             if isinstance(t, Buy) and t.acquisition and t.t_type not in self.NO_MATCH_TYPES:
-                if (t.asset, t.timestamp.date()) not in buy_transactions:
-                    buy_transactions[(t.asset, t.timestamp.date())] = t
+                key = (t.asset, t.day)
+                if key not in buy_transactions:
+                    buy_transactions[key] = copy.copy(t)
                 else:
-                    buy_transactions[(t.asset, t.timestamp.date())] += t
+                    buy_transactions[key] += t
             elif isinstance(t, Sell) and t.disposal and t.t_type not in self.NO_MATCH_TYPES:
-                if (t.asset, t.timestamp.date()) not in sell_transactions:
-                    sell_transactions[(t.asset, t.timestamp.date())] = t
+                key = (t.asset, t.day)
+                if key not in sell_transactions:
+                    sell_transactions[key] = copy.copy(t)
                 else:
-                    sell_transactions[(t.asset, t.timestamp.date())] += t
+                    sell_transactions[key] += t
             else:
-                self.other_transactions.append(t)
+                if t.t_type in self.NO_GAIN_NO_LOSS_TYPES:
+                    # Proceeds are changed by section 104
+                    t = copy.copy(t)
+
+                if t.asset not in self.other_transactions:
+                    self.other_transactions[t.asset] = []
 
-        self.buys_ordered = sorted(buy_transactions.values())
-        self.sells_ordered = sorted(sell_transactions.values())
+                self.other_transactions[t.asset].append(t)
 
-        if config.debug:
-            for t in sorted(self.all_transactions()):
-                if len(t.pooled) > 1:
-                    print("%spool: %s" % (Fore.GREEN, t.__str__(pooled_bold=True)))
+        # Only one pooled transaction per asset and day, so the key gives the same order as
+        #  their timestamps
+        for key in sorted(buy_transactions):
+            self.buys.append(buy_transactions[key])
+
+        for key in sorted(sell_transactions):
+            self.sells.append(sell_transactions[key])
+
+        if pool_log.is_debug():
+            for t in self.all_transactions():
+                if len(t.pooled) > 1 and pool_log.is_debug(t.asset):
+                    pool_log.debug(Fore.GREEN, "pool: %s", t.__str__(pooled_bold=True),
+                                   asset=t.asset)
                     for tp in t.pooled:
-                        print("%spool:   (%s)" % (Fore.BLUE, tp))
+                        pool_log.debug(Fore.BLUE, "pool:   (%s)", tp, asset=t.asset)
 
-        if config.debug:
-            print("%spool: total transactions=%d" % (Fore.CYAN, len(self.all_transactions())))
+            pool_log.debug(Fore.CYAN, "pool: total transactions=%d",
+                           len(self.all_transactions()))
 
     def match_buyback(self, rule):
-        sell_index = buy_index = 0
-
-        if not self.buys_ordered:
+        if not self.buys:
             return
 
-        if config.debug:
-            print("%smatch %s transactions" % (Fore.CYAN, rule.lower()))
+        match_log.debug(Fore.CYAN, "match %s transactions", rule.lower())
 
-        pbar = tqdm(total=len(self.sells_ordered),
-                    unit='t',
-                    desc="%smatch %s transactions%s" % (Fore.CYAN, rule.lower(), Fore.GREEN),
-                    disable=bool(config.debug or not sys.stdout.isatty()))
+        self._resume_matches(rule, self.buys)
 
-        while sell_index < len(self.sells_ordered):
-            s = self.sells_ordered[sell_index]
-            b = self.buys_ordered[buy_index]
+        for s_run in progress(self.sells.runs(), "match %s transactions" % rule.lower(), unit='t'):
+            s = s_run[-1]
+            while not s.matched:
+                first_day, last_day = self._rule_window(rule, s.day, is_buy=False)
+                b_run = self.buys.find(s.asset, first_day, last_day)
+                if not b_run:
+                    break
 
-            if (not s.matched and not b.matched and s.asset == b.asset and
-                    self._rule_match(b.timestamp, s.timestamp, rule)):
-                if config.debug:
+                b = b_run[-1]
+                if match_log.is_debug(s.asset):
                     if b.quantity > s.quantity:
-                        print("%smatch: %s" % (Fore.GREEN, s.__str__(quantity_bold=True)))
-                        print("%smatch: %s" % (Fore.GREEN, b))
+                        match_log.debug(Fore.GREEN, "match: %s", s.__str__(quantity_bold=True),
+                                        asset=s.asset)
+                        match_log.debug(Fore.GREEN, "match: %s", b, asset=b.asset)
                     elif s.quantity > b.quantity:
-                        print("%smatch: %s" % (Fore.GREEN, s))
-                        print("%smatch: %s" % (Fore.GREEN, b.__str__(quantity_bold=True)))
+                        match_log.debug(Fore.GREEN, "match: %s", s, asset=s.asset)
+                        match_log.debug(Fore.GREEN, "match: %s", b.__str__(quantity_bold=True),
+                                        asset=b.asset)
                     else:
-                        print("%smatch: %s" % (Fore.GREEN, s.__str__(quantity_bold=True)))
-                        print("%smatch: %s" % (Fore.GREEN, b.__str__(quantity_bold=True)))
+                        match_log.debug(Fore.GREEN, "match: %s", s.__str__(quantity_bold=True),
+                                        asset=s.asset)
+                        match_log.debug(Fore.GREEN, "match: %s", b.__str__(quantity_bold=True),
+                                        asset=b.asset)
 
                 if b.quantity > s.quantity:
                     b_remainder = b.split_buy(s.quantity)
-                    self.buys_ordered.insert(buy_index + 1, b_remainder)
-                    if config.debug:
-                        print("%smatch:   split: %s" % (Fore.YELLOW, b.__str__(quantity_bold=True)))
-                        print("%smatch:   split: %s" % (Fore.YELLOW, b_remainder))
+                    self.buys.split(b_run, b_remainder)
+                    if match_log.is_debug(b.asset):
+                        match_log.debug(Fore.YELLOW, "match:   split: %s",
+                                        b.__str__(quantity_bold=True), asset=b.asset)
+                        match_log.debug(Fore.YELLOW, "match:   split: %s", b_remainder,
+                                        asset=b.asset)
                 elif s.quantity > b.quantity:
                     s_remainder = s.split_sell(b.quantity)
-                    self.sells_ordered.insert(sell_index + 1, s_remainder)
-                    if config.debug:
-                        print("%smatch:   split: %s" % (Fore.YELLOW, s.__str__(quantity_bold=True)))
-                        print("%smatch:   split: %s" % (Fore.YELLOW, s_remainder))
-                    pbar.total += 1
+                    self.sells.split(s_run, s_remainder)
+                    if match_log.is_debug(s.asset):
+                        match_log.debug(Fore.YELLOW, "match:   split: %s",
+                                        s.__str__(quantity_bold=True), asset=s.asset)
+                        match_log.debug(Fore.YELLOW, "match:   split: %s", s_remainder,
+                                        asset=s.asset)
 
                 s.matched = b.matched = True
                 tax_event = TaxEventCapitalGains(rule, b, s, b.cost,
                                                  (b.fee_value or Decimal(0)) +
                                                  (s.fee_value or Decimal(0)))
                 self.tax_events[self.which_tax_year(tax_event.date)].append(tax_event)
-                if config.debug:
-                    print("%smatch:   %s" % (Fore.CYAN, tax_event))
-
-                # Find next sell
-                sell_index += 1
-                pbar.update(1)
-                buy_index = 0
-            else:
-                buy_index += 1
-                if buy_index >= len(self.buys_ordered):
-                    sell_index += 1
-                    pbar.update(1)
-                    buy_index = 0
+                self._snapshot_match(rule, s, b, tax_event)
+                match_log.debug(Fore.CYAN, "match:   %s", tax_event, asset=tax_event.asset)
 
-        pbar.close()
+                # Continue matching with what is left of the sell
+                s = s_run[-1]
 
-        if config.debug:
-            print("%smatch: total transactions=%d" % (Fore.CYAN, len(self.all_transactions())))
+        if match_log.is_debug():
+            match_log.debug(Fore.CYAN, "match: total transactions=%d",
+                            len(self.all_transactions()))
 
     def match_sell(self, rule):
-        buy_index = sell_index = 0
-
-        if not self.sells_ordered:
+        if not self.sells:
             return
 
-        if config.debug:
-            print("%smatch %s transactions" % (Fore.CYAN, rule.lower()))
+        match_log.debug(Fore.CYAN, "match %s transactions", rule.lower())
 
-        pbar = tqdm(total=len(self.buys_ordered),
-                    unit='t',
-                    desc="%smatch %s transactions%s" % (Fore.CYAN, rule.lower(), Fore.GREEN),
-                    disable=bool(config.debug or not sys.stdout.isatty()))
+        self._resume_matches(rule, self.sells)
 
-        while buy_index < len(self.buys_ordered):
-            b = self.buys_ordered[buy_index]
-            s = self.sells_ordered[sell_index]
+        for b_run in progress(self.buys.runs(), "match %s transactions" % rule.lower(), unit='t'):
+            b = b_run[-1]
+            while not b.matched:
+                first_day, last_day = self._rule_window(rule, b.day, is_buy=True)
+                s_run = self.sells.find(b.asset, first_day, last_day)
+                if not s_run:
+                    break
 
-            if (not b.matched and not s.matched and b.asset == s.asset and
-                    self._rule_match(b.timestamp, s.timestamp, rule)):
-                if config.debug:
+                s = s_run[-1]
+                if match_log.is_debug(b.asset):
                     if b.quantity > s.quantity:
-                        print("%smatch: %s" % (Fore.GREEN, b))
-                        print("%smatch: %s" % (Fore.GREEN, s.__str__(quantity_bold=True)))
+                        match_log.debug(Fore.GREEN, "match: %s", b, asset=b.asset)
+                        match_log.debug(Fore.GREEN, "match: %s", s.__str__(quantity_bold=True),
+                                        asset=s.asset)
                     elif s.quantity > b.quantity:
-                        print("%smatch: %s" % (Fore.GREEN, b.__str__(quantity_bold=True)))
-                        print("%smatch: %s" % (Fore.GREEN, s))
+                        match_log.debug(Fore.GREEN, "match: %s", b.__str__(quantity_bold=True),
+                                        asset=b.asset)
+                        match_log.debug(Fore.GREEN, "match: %s", s, asset=s.asset)
                     else:
-                        print("%smatch: %s" % (Fore.GREEN, b.__str__(quantity_bold=True)))
-                        print("%smatch: %s" % (Fore.GREEN, s.__str__(quantity_bold=True)))
+                        match_log.debug(Fore.GREEN, "match: %s", b.__str__(quantity_bold=True),
+                                        asset=b.asset)
+                        match_log.debug(Fore.GREEN, "match: %s", s.__str__(quantity_bold=True),
+                                        asset=s.asset)
 
                 if b.quantity > s.quantity:
                     b_remainder = b.split_buy(s.quantity)
-                    self.buys_ordered.insert(buy_index + 1, b_remainder)
-                    if config.debug:
-                        print("%smatch:   split: %s" % (Fore.YELLOW, b.__str__(quantity_bold=True)))
-                        print("%smatch:   split: %s" % (Fore.YELLOW, b_remainder))
-                    pbar.total += 1
+                    self.buys.split(b_run, b_remainder)
+                    if match_log.is_debug(b.asset):
+                        match_log.debug(Fore.YELLOW, "match:   split: %s",
+                                        b.__str__(quantity_bold=True), asset=b.asset)
+                        match_log.debug(Fore.YELLOW, "match:   split: %s", b_remainder,
+                                        asset=b.asset)
                 elif s.quantity > b.quantity:
                     s_remainder = s.split_sell(b.quantity)
-                    self.sells_ordered.insert(sell_index + 1, s_remainder)
-                    if config.debug:
-                        print("%smatch:   split: %s" % (Fore.YELLOW, s.__str__(quantity_bold=True)))
-                        print("%smatch:   split: %s" % (Fore.YELLOW, s_remainder))
+                    self.sells.split(s_run, s_remainder)
+                    if match_log.is_debug(s.asset):
+                        match_log.debug(Fore.YELLOW, "match:   split: %s",
+                                        s.__str__(quantity_bold=True), asset=s.asset)
+                        match_log.debug(Fore.YELLOW, "match:   split: %s", s_remainder,
+                                        asset=s.asset)
 
                 b.matched = s.matched = True
                 tax_event = TaxEventCapitalGains(rule, b, s, b.cost,
                                                  (b.fee_value or Decimal(0)) +
                                                  (s.fee_value or Decimal(0)))
                 self.tax_events[self.which_tax_year(tax_event.date)].append(tax_event)
-                if config.debug:
-                    print("%smatch:   %s" % (Fore.CYAN, tax_event))
+                self._snapshot_match(rule, b, s, tax_event)
+                match_log.debug(Fore.CYAN, "match:   %s", tax_event, asset=tax_event.asset)
 
-                # Find next buy
-                buy_index += 1
-                pbar.update(1)
-                sell_index = 0
-            else:
-                sell_index += 1
-                if sell_index >= len(self.sells_ordered):
-                    buy_index += 1
-                    pbar.update(1)
-                    sell_index = 0
+                # Continue matching with what is left of the buy
+                b = b_run[-1]
 
-        pbar.close()
+        if match_log.is_debug():
+            match_log.debug(Fore.CYAN, "match: total transactions=%d",
+                            len(self.all_transactions()))
 
-        if config.debug:
-            print("%smatch: total transactions=%d" % (Fore.CYAN, len(self.all_transactions())))
-
-    def _rule_match(self, b_timestamp, s_timestamp, rule):
+    def _rule_window(self, rule, day, is_buy):
+        # Returns the range of day ordinals (inclusive) in which a matching transaction must
+        #  fall, relative to the day of the buy (is_buy=True) or sell being matched
         if rule == self.DISPOSAL_SAME_DAY:
-            return b_timestamp.date() == s_timestamp.date()
+            return day, day
         if rule == self.DISPOSAL_TEN_DAY:
             # 10 days between buy and sell
-            return (b_timestamp.date() < s_timestamp.date() and
-                    s_timestamp.date() <= b_timestamp.date() + timedelta(days=10))
+            if is_buy:
+                return day + 1, day + 10
+            return day - 10, day - 1
         if rule == self.DISPOSAL_BED_AND_BREAKFAST:
             # 30 days between sell and buy-back
-            return (s_timestamp.date() < b_timestamp.date() and
-                    b_timestamp.date() <= s_timestamp.date() + timedelta(days=30))
+            if is_buy:
+                return day - 30, day - 1
+            return day + 1, day + 30
         if not rule:
-            return True
+            return None, None
 
         raise Exception
 
+    def _carry_rule(self):
+        # The only rule which can match transactions either side of a tax year end
+        if self.tax_rules in config.TAX_RULES_UK_COMPANY:
+            return self.DISPOSAL_TEN_DAY
+        return self.DISPOSAL_BED_AND_BREAKFAST
+
+    def _snapshot(self, asset, tax_year):
+        if tax_year not in self.snapshots:
+            self.snapshots[tax_year] = {}
+
+        if asset not in self.snapshots[tax_year]:
+            self.snapshots[tax_year][asset] = {'holdings': None,
+                                               'matched': {},
+                                               'tax_events': [],
+                                               'disposals': []}
+        return self.snapshots[tax_year][asset]
+
+    def _snapshot_disposals(self):
+        for tax_year in self.tax_events:
+            for te in self.tax_events[tax_year]:
+                if te.asset in self.resumed and tax_year <= self.resumed[te.asset][0]:
+                    # Reused from the snapshot
+                    continue
+
+                self._snapshot(te.asset, tax_year)['disposals'].append(te)
+
+    def _snapshot_match(self, rule, t, t_match, tax_event):
+        # Record where a transaction has been matched with one after the end of its tax year, so
+        #  the match can be made again when resuming from the snapshot
+        if rule != self._carry_rule():
+            return
+
+        tax_year = config.get_tax_year_of_day(t.day)
+        if config.get_tax_year_of_day(t_match.day) > tax_year:
+            snapshot = self._snapshot(t.asset, tax_year)
+            day = t_match.day
+            if day not in snapshot['matched']:
+                snapshot['matched'][day] = []
+
+            snapshot['matched'][day].append(t_match.quantity)
+
+            if config.get_tax_year(tax_event.date) > tax_year:
+                snapshot['tax_events'].append(tax_event)
+
+    def _resume_matches(self, rule, pooled):
+        if rule != self._carry_rule():
+            return
+
+        for asset in sorted(self.resumed):
+            matched = self.resumed[asset][1]['matched']
+            for day in sorted(matched):
+                t_run = pooled.find(asset, day, day)
+                for quantity in matched[day]:
+                    t = t_run[-1]
+                    if t.quantity > quantity:
+                        if isinstance(t, Buy):
+                            t_remainder = t.split_buy(quantity)
+                        else:
+                            t_remainder = t.split_sell(quantity)
+
+                        pooled.split(t_run, t_remainder)
+
+                    t.matched = True
+                    match_log.debug(Fore.BLUE, "match: %s <- matched before snapshot", t,
+                                    asset=asset)
+
     def process_section104(self, skip_integrity_check):
-        if config.debug:
-            print("%sprocess section 104" % Fore.CYAN)
+        section104_log.debug(Fore.CYAN, "process section 104")
+
+        # Tax year of the last transaction for each asset
+        tax_years = {}
+        for asset in self.resumed:
+            self.holdings[asset] = copy.copy(self.resumed[asset][1]['holdings'])
 
-        for t in tqdm(sorted(self.all_transactions()),
-                      unit='t',
-                      desc="%sprocess section 104%s" % (Fore.CYAN, Fore.GREEN),
-                      disable=bool(config.debug or not sys.stdout.isatty())):
+        for t in progress(self.all_transactions(), "process section 104", unit='t'):
             if t.asset not in self.holdings:
                 self.holdings[t.asset] = Holdings(t.asset)
 
+            tax_year = config.get_tax_year_of_day(t.day)
+            if t.asset not in tax_years and t.asset in self.resumed:
+                tax_years[t.asset] = self.resumed[t.asset][0] + 1
+
+            if t.asset in tax_years and tax_year > tax_years[t.asset]:
+                self._snapshot_holdings(t.asset, tax_years[t.asset], tax_year)
+            tax_years[t.asset] = tax_year
+
             if t.matched:
-                if config.debug:
-                    print("%ssection104: //%s <- matched" % (Fore.BLUE, t))
+                if section104_log.is_debug(t.asset):
+                    section104_log.debug(Fore.BLUE, "section104: //%s <- matched", t,
+                                         asset=t.asset)
                 continue
 
             if not config.transfers_include and t.t_type in self.TRANSFER_TYPES:
-                if config.debug:
-                    print("%ssection104: //%s <- transfer" % (Fore.BLUE, t))
+                if section104_log.is_debug(t.asset):
+                    section104_log.debug(Fore.BLUE, "section104: //%s <- transfer", t,
+                                         asset=t.asset)
                 continue
 
-            if config.debug:
-                print("%ssection104: %s" % (Fore.GREEN, t))
+            if section104_log.is_debug(t.asset):
+                section104_log.debug(Fore.GREEN, "section104: %s", t, asset=t.asset)
 
             if isinstance(t, Buy):
                 self._add_tokens(t)
             elif isinstance(t, Sell):
                 self._subtract_tokens(t, skip_integrity_check)
 
+        for asset in tax_years:
+            self._snapshot_holdings(asset, tax_years[asset], tax_years[asset] + 1)
+
+    def _snapshot_holdings(self, asset, from_tax_year, to_tax_year):
+        for tax_year in range(from_tax_year, to_tax_year):
+            self._snapshot(asset, tax_year)['holdings'] = copy.copy(self.holdings[asset])
+
     def _add_tokens(self, t):
         if not t.acquisition:
             cost = fees = Decimal(0)
@@ -281,10 +576,10 @@ class TaxCalculator(object):
             cost = fees = Decimal(0)
         else:
             if self.holdings[t.asset].quantity:
-                cost = self.holdings[t.asset].cost * (t.quantity /
-                                                      self.holdings[t.asset].quantity)
-                fees = self.holdings[t.asset].fees * (t.quantity /
-                                                      self.holdings[t.asset].quantity)
+                # Same proportion of the pool for both
+                proportion = t.quantity / self.holdings[t.asset].quantity
+                cost = self.holdings[t.asset].cost * proportion
+                fees = self.holdings[t.asset].fees * proportion
             else:
                 # Should never happen, only if incorrect transaction records
                 cost = fees = Decimal(0)
@@ -305,38 +600,56 @@ class TaxCalculator(object):
                                                  None, t, cost, fees + (t.fee_value or Decimal(0)))
 
             self.tax_events[self.which_tax_year(tax_event.date)].append(tax_event)
-            if config.debug:
-                print("%ssection104:   %s" % (Fore.CYAN, tax_event))
+            section104_log.debug(Fore.CYAN, "section104:   %s", tax_event, asset=t.asset)
 
             if config.transfers_include and not skip_integrity_check:
                 self.holdings[t.asset].check_transfer_mismatch()
 
     def process_income(self):
-        if config.debug:
-            print("%sprocess income" % Fore.CYAN)
+        income_log.debug(Fore.CYAN, "process income")
 
-        for t in tqdm(self.transactions,
-                      unit='t',
-                      desc="%sprocess income%s" % (Fore.CYAN, Fore.GREEN),
-                      disable=bool(config.debug or not sys.stdout.isatty())):
+        if self.income_transactions is not None:
+            transactions = self.income_transactions
+        else:
+            transactions = self.transactions
+
+        for t in progress(transactions, "process income", unit='t'):
             if t.t_type in self.INCOME_TYPES:
                 tax_event = TaxEventIncome(t)
                 self.tax_events[self.which_tax_year(tax_event.date)].append(tax_event)
 
     def all_transactions(self):
-        if not config.transfers_include:
-            # Ordered so transfers appear before the fee spend in the log
-            return self.other_transactions + self.buys_ordered + self.sells_ordered
-        return self.buys_ordered + self.sells_ordered + self.other_transactions
+        transactions = []
+
+        for asset in sorted(set(self.buys.assets) | set(self.sells.assets) |
+                            set(self.other_transactions)):
+            if not config.transfers_include:
+                # Ordered so transfers appear before the fee spend in the log
+                transactions.extend(self._merge(self.other_transactions.get(asset, []),
+                                                self.buys.transactions(asset),
+                                                self.sells.transactions(asset)))
+            else:
+                transactions.extend(self._merge(self.buys.transactions(asset),
+                                                self.sells.transactions(asset),
+                                                self.other_transactions.get(asset, [])))
+        return transactions
+
+    @staticmethod
+    def _merge(*transactions):
+        # Each list is already in timestamp order, so just merge them, for the same timestamp
+        #  the order of the lists is kept
+        return [t for _, t in heapq.merge(*[[((t.timestamp, i, j), t)
+                                              for j, t in enumerate(ts)]
+                                             for i, ts in enumerate(transactions)])]
 
     def calculate_capital_gains(self, tax_year):
         self.tax_report[tax_year] = {}
         self.tax_report[tax_year]['CapitalGains'] = CalculateCapitalGains(tax_year, self.tax_rules)
 
         if tax_year in self.tax_events:
-            for te in sorted(self.tax_events[tax_year]):
-                if isinstance(te, TaxEventCapitalGains):
-                    self.tax_report[tax_year]['CapitalGains'].tax_summary(te)
+            self.tax_report[tax_year]['CapitalGains'].tax_summary(
+                sorted((te for te in self.tax_events[tax_year]
+                        if isinstance(te, TaxEventCapitalGains)), key=attrgetter('date')))
 
         if self.tax_rules in config.TAX_RULES_UK_COMPANY:
             self.tax_report[tax_year]['CapitalGains'].tax_estimate_ct(tax_year)
@@ -347,9 +660,9 @@ class TaxCalculator(object):
         self.tax_report[tax_year]['Income'] = CalculateIncome()
 
         if tax_year in self.tax_events:
-            for te in sorted(self.tax_events[tax_year]):
-                if isinstance(te, TaxEventIncome):
-                    self.tax_report[tax_year]['Income'].totalise(te)
+            self.tax_report[tax_year]['Income'].totalise(
+                sorted((te for te in self.tax_events[tax_year]
+                        if isinstance(te, TaxEventIncome)), key=attrgetter('date')))
 
         self.tax_report[tax_year]['Income'].totals_by_type()
 
@@ -359,13 +672,9 @@ class TaxCalculator(object):
                   'value': Decimal(0),
                   'gain': Decimal(0)}
 
-        if config.debug:
-            print("%scalculating holdings" % Fore.CYAN)
+        holdings_log.debug(Fore.CYAN, "calculating holdings")
 
-        for h in tqdm(self.holdings,
-                      unit='h',
-                      desc="%scalculating holdings%s" % (Fore.CYAN, Fore.GREEN),
-                      disable=bool(config.debug or not sys.stdout.isatty())):
+        for h in progress(self.holdings, "calculating holdings", unit='h'):
             if self.holdings[h].quantity > 0 or config.show_empty_wallets:
                 holdings[h] = {}
                 holdings[h]['asset'] = self.holdings[h].asset
@@ -390,17 +699,100 @@ class TaxCalculator(object):
         self.holdings_report['totals'] = totals
 
     def which_tax_year(self, timestamp):
-        if timestamp > config.get_tax_year_end(timestamp.year):
-            tax_year = timestamp.year + 1
-        else:
-            tax_year = timestamp.year
-
+        tax_year = config.get_tax_year(timestamp)
         if tax_year not in self.tax_events:
             self.tax_events[tax_year] = []
 
         return tax_year
 
+# Transactions by asset, for worker processes to inherit
+ASSET_TRANSACTIONS = {}
+
+def is_forked():
+    if sys.version_info[:2] >= (3, 4):
+        return multiprocessing.get_start_method() == 'fork'
+    return sys.platform != 'win32'
+
+def init_process_asset(start_of_year_month, start_of_year_day):
+    config.start_of_year_month = start_of_year_month
+    config.start_of_year_day = start_of_year_day
+    # Only the parent process is profiled, and reports progress
+    profiler.disable()
+    progress.set_stream(None)
+
+def process_asset(args):
+    asset, transactions, tax_rules, skip_integrity_check, resumed = args
+
+    if transactions is None:
+        transactions = ASSET_TRANSACTIONS[asset]
+
+    # Capture any warnings, so they can be output in order by the parent process
+    stdout = sys.stdout
+    if sys.version_info[0] < 3:
+        sys.stdout = io.BytesIO()
+    else:
+        sys.stdout = io.StringIO()
+
+    try:
+        tax = TaxCalculator(transactions, tax_rules)
+        if resumed:
+            tax.resumed[asset] = resumed
+
+        tax.process_disposals(skip_integrity_check)
+        return tax.tax_events, tax.holdings, tax.snapshots, sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+class PooledTransactions(object):
+    # Pooled transactions ordered by asset and day. Each day holds a run of the pooled
+    #  transaction followed by any remainders split from it, only the last can be unmatched
+    def __init__(self):
+        self.assets = {}
+        self.count = 0
+
+    def append(self, t):
+        # Transactions must be appended in (asset, timestamp) order
+        if t.asset not in self.assets:
+            self.assets[t.asset] = ([], [])
+
+        days, runs = self.assets[t.asset]
+        days.append(t.day)
+        runs.append([t])
+        self.count += 1
+
+    def split(self, run, remainder):
+        run.append(remainder)
+        self.count += 1
+
+    def find(self, asset, first_day, last_day):
+        if asset not in self.assets:
+            return None
+
+        days, runs = self.assets[asset]
+        i = bisect_left(days, first_day) if first_day is not None else 0
+
+        while i < len(days) and (last_day is None or days[i] <= last_day):
+            if not runs[i][-1].matched:
+                return runs[i]
+            i += 1
+
+        return None
+
+    def runs(self):
+        return [run for asset in sorted(self.assets) for run in self.assets[asset][1]]
+
+    def transactions(self, asset):
+        if asset not in self.assets:
+            return []
+
+        return [t for run in self.assets[asset][1] for t in run]
+
+    def __len__(self):
+        return self.count
+
 class TaxEvent(object):
+    __slots__ = ('date', 'asset')
+
     def __init__(self, date, asset):
         self.date = date
         self.asset = asset
@@ -415,6 +807,9 @@ class TaxEvent(object):
         return self.date < other.date
 
 class TaxEventCapitalGains(TaxEvent):
+    __slots__ = ('disposal_type', 'quantity', 'cost', 'fees', 'proceeds', 'gain',
+                 'acquisition_date')
+
     def __init__(self, disposal_type, b, s, cost, fees):
         super(TaxEventCapitalGains, self).__init__(s.timestamp, s.asset)
         self.disposal_type = disposal_type
@@ -441,6 +836,8 @@ class TaxEventCapitalGains(TaxEvent):
             config.sym() + '{:0,.2f}'.format(self.fees))
 
 class TaxEventIncome(TaxEvent):
+    __slots__ = ('type', 'quantity', 'amount', 'note', 'fees')
+
     def __init__(self, b):
         super(TaxEventIncome, self).__init__(b.timestamp, b.asset)
         self.type = b.t_type
@@ -484,6 +881,11 @@ class CalculateCapitalGains(object):
                        2020: {'small_rate': None, 'main_rate': 19},
                        2021: {'small_rate': None, 'main_rate': 19}}
 
+    # Day each rate starts from, and the day after the last rate ends
+    CT_RATE_YEARS = sorted(CG_DATA_COMPANY)
+    CT_RATE_DAYS = list(date(year, 4, 1).toordinal()
+                        for year in CT_RATE_YEARS + [CT_RATE_YEARS[-1] + 1])
+
     def __init__(self, tax_year, tax_rules):
         self.totals = {'cost': Decimal(0),
                        'fees': Decimal(0),
@@ -511,29 +913,54 @@ class CalculateCapitalGains(object):
                              'proceeds_warning': False}
         self.assets = {}
 
-    def get_ct_rate(self, date):
-        if date < datetime(date.year, 4, 1, tzinfo=config.TZ_LOCAL):
-            # Use rate from previous year
-            return self.CG_DATA_COMPANY[date.year-1]['small_rate'], \
-                   self.CG_DATA_COMPANY[date.year-1]['main_rate']
-        return self.CG_DATA_COMPANY[date.year]['small_rate'], \
-               self.CG_DATA_COMPANY[date.year]['main_rate']
-
-    def tax_summary(self, te):
-        self.summary['disposals'] += 1
-        self.totals['cost'] += te.cost
-        self.totals['fees'] += te.fees
-        self.totals['proceeds'] += te.proceeds
-        self.totals['gain'] += te.gain
-        if te.gain >= 0:
-            self.summary['total_gain'] += te.gain
-        else:
-            self.summary['total_loss'] += te.gain
+    def get_ct_rate_periods(self, start_day, end_day):
+        # Split the days (inclusive) into periods at the same rate, as a list of
+        #  (small_rate, main_rate, days)
+        periods = []
+        i = bisect_right(self.CT_RATE_DAYS, start_day) - 1
+
+        while start_day <= end_day:
+            if not 0 <= i < len(self.CT_RATE_YEARS):
+                # No rate for this year
+                day = date.fromordinal(start_day)
+                raise KeyError(day.year if day.month >= 4 else day.year - 1)
+
+            period_end_day = min(end_day, self.CT_RATE_DAYS[i+1] - 1)
+            periods.append((self.CG_DATA_COMPANY[self.CT_RATE_YEARS[i]]['small_rate'],
+                            self.CG_DATA_COMPANY[self.CT_RATE_YEARS[i]]['main_rate'],
+                            period_end_day - start_day + 1))
+            start_day = period_end_day + 1
+            i += 1
+
+        return periods
+
+    def tax_summary(self, tax_events):
+        # Totalled in local variables, it's the dictionary updates for each disposal which
+        #  are costly, not the additions
+        cost = fees = proceeds = gain = total_gain = total_loss = Decimal(0)
+
+        for te in tax_events:
+            cost += te.cost
+            fees += te.fees
+            proceeds += te.proceeds
+            gain += te.gain
+            if te.gain >= 0:
+                total_gain += te.gain
+            else:
+                total_loss += te.gain
 
-        if te.asset not in self.assets:
-            self.assets[te.asset] = []
+            if te.asset not in self.assets:
+                self.assets[te.asset] = []
 
-        self.assets[te.asset].append(te)
+            self.assets[te.asset].append(te)
+
+        self.summary['disposals'] += len(tax_events)
+        self.totals['cost'] += cost
+        self.totals['fees'] += fees
+        self.totals['proceeds'] += proceeds
+        self.totals['gain'] += gain
+        self.summary['total_gain'] += total_gain
+        self.summary['total_loss'] += total_loss
 
     def tax_estimate_cgt(self, tax_year):
         if self.totals['gain'] > self.estimate['allowance']:
@@ -553,13 +980,10 @@ class CalculateCapitalGains(object):
         if self.totals['gain'] > 0:
             self.estimate['taxable_gain'] = self.totals['gain']
 
-        start_date = config.get_tax_year_start(tax_year)
-        end_date = config.get_tax_year_end(tax_year)
-        day_count = (end_date - start_date).days + 1
-
-        for date in (start_date + timedelta(n) for n in range(day_count)):
-            small_rate, main_rate = self.get_ct_rate(date)
+        start_day, end_day = config.get_tax_year_days(tax_year)
+        day_count = end_day - start_day + 1
 
+        for small_rate, main_rate, days in self.get_ct_rate_periods(start_day, end_day):
             if small_rate not in self.estimate['ct_small_rates']:
                 self.estimate['ct_small_rates'].append(small_rate)
 
@@ -569,14 +993,16 @@ class CalculateCapitalGains(object):
             if self.estimate['taxable_gain'] > 0:
                 if small_rate is None:
                     # Use main rate if there isn't a small rate
-                    self.estimate['ct_small'] += self.estimate['taxable_gain'] / day_count * \
-                                                 main_rate / 100
+                    ct_small = self.estimate['taxable_gain'] / day_count * main_rate / 100
                 else:
-                    self.estimate['ct_small'] += self.estimate['taxable_gain'] / day_count * \
-                                                 small_rate / 100
+                    ct_small = self.estimate['taxable_gain'] / day_count * small_rate / 100
 
-                self.estimate['ct_main'] += self.estimate['taxable_gain'] / day_count * \
-                                            main_rate / 100
+                ct_main = self.estimate['taxable_gain'] / day_count * main_rate / 100
+
+                # Apportioned a day at a time, so it's rounded the same as it always has been
+                for _ in range(days):
+                    self.estimate['ct_small'] += ct_small
+                    self.estimate['ct_main'] += ct_main
 
         if self.estimate['ct_small_rates'] == [None]:
             # No small rate so remove estimate
@@ -591,27 +1017,33 @@ class CalculateIncome(object):
         self.types = {}
         self.type_totals = {}
 
-    def totalise(self, te):
-        self.totals['amount'] += te.amount
-        self.totals['fees'] += te.fees
+    def totalise(self, tax_events):
+        amount = fees = Decimal(0)
+
+        for te in tax_events:
+            amount += te.amount
+            fees += te.fees
 
-        if te.asset not in self.assets:
-            self.assets[te.asset] = []
+            if te.asset not in self.assets:
+                self.assets[te.asset] = []
 
-        self.assets[te.asset].append(te)
+            self.assets[te.asset].append(te)
 
-        if te.type not in self.types:
-            self.types[te.type] = []
+            if te.type not in self.types:
+                self.types[te.type] = []
 
-        self.types[te.type].append(te)
+            self.types[te.type].append(te)
+
+        self.totals['amount'] += amount
+        self.totals['fees'] += fees
 
     def totals_by_type(self):
         for income_type in self.types:
-            for te in self.types[income_type]:
-                if income_type not in self.type_totals:
-                    self.type_totals[income_type] = {}
-                    self.type_totals[income_type]['amount'] = te.amount
-                    self.type_totals[income_type]['fees'] = te.fees
-                else:
-                    self.type_totals[income_type]['amount'] += te.amount
-                    self.type_totals[income_type]['fees'] += te.fees
+            amount = self.types[income_type][0].amount
+            fees = self.types[income_type][0].fees
+
+            for te in self.types[income_type][1:]:
+                amount += te.amount
+                fees += te.fees
+
+            self.type_totals[income_type] = {'amount': amount, 'fees': fees}
@@ -5,25 +5,29 @@ import sys
 import copy
 
 from colorama import Fore, Style
-from tqdm import tqdm
 
 from .config import config
 from .record import TransactionRecord
+from .progress import progress
+from .log import get_log
+
+log = get_log('split')
 
 class TransactionHistory(object):
-    def __init__(self, transaction_records, value_asset):
+    def __init__(self, transaction_records, value_asset, audit=None):
         self.value_asset = value_asset
         self.transactions = []
+        self.income_transactions = []
+
+        log.debug(Fore.CYAN, "split transaction records")
 
-        if config.debug:
-            print("%ssplit transaction records" % Fore.CYAN)
+        # Records are audited in the same pass, if required, so they are only traversed once
+        for tr in progress(transaction_records, "split transaction records", unit='tr'):
+            if audit:
+                audit.audit_record(tr)
 
-        for tr in tqdm(transaction_records,
-                       unit='tr',
-                       desc="%ssplit transaction records%s" % (Fore.CYAN, Fore.GREEN),
-                       disable=bool(config.debug or not sys.stdout.isatty())):
-            if config.debug:
-                print("%ssplit: TR %s" % (Fore.MAGENTA, tr))
+            if log.is_debug():
+                log.debug(Fore.MAGENTA, "split: TR %s", tr, asset=tr.assets())
 
             self.get_all_values(tr)
 
@@ -66,24 +70,28 @@ class TransactionHistory(object):
                     tr.buy.asset not in config.fiat_list:
                 tr.buy.set_tid()
                 self.transactions.append(tr.buy)
-                if config.debug:
-                    print("%ssplit:   %s" % (Fore.GREEN, tr.buy))
+                if tr.buy.t_type in Buy.INCOME_TYPES:
+                    self.income_transactions.append(tr.buy)
+                if log.is_debug(tr.buy.asset):
+                    log.debug(Fore.GREEN, "split:   %s", tr.buy, asset=tr.buy.asset)
 
             if tr.sell and (tr.sell.quantity or tr.sell.fee_value) and \
                     tr.sell.asset not in config.fiat_list:
                 tr.sell.set_tid()
                 self.transactions.append(tr.sell)
-                if config.debug:
-                    print("%ssplit:   %s" % (Fore.GREEN, tr.sell))
+                if log.is_debug(tr.sell.asset):
+                    log.debug(Fore.GREEN, "split:   %s", tr.sell, asset=tr.sell.asset)
 
             if tr.fee and tr.fee.quantity and tr.fee.asset not in config.fiat_list:
                 tr.fee.set_tid()
                 self.transactions.append(tr.fee)
-                if config.debug:
-                    print("%ssplit:   %s" % (Fore.GREEN, tr.fee))
+                if log.is_debug(tr.fee.asset):
+                    log.debug(Fore.GREEN, "split:   %s", tr.fee, asset=tr.fee.asset)
+
+        log.debug(Fore.CYAN, "split: total transactions=%d", len(self.transactions))
 
-        if config.debug:
-            print("%ssplit: total transactions=%d" % (Fore.CYAN, len(self.transactions)))
+        if audit:
+            audit.output_balances()
 
     def get_all_values(self, tr):
         if tr.buy and tr.buy.acquisition and tr.buy.cost is None:
@@ -140,46 +148,76 @@ class TransactionHistory(object):
                                                                      tr.fee.timestamp,
                                                                      tr.fee.quantity)
     def which_asset_value(self, tr):
-        if config.trade_asset_type == config.TRADE_ASSET_TYPE_BUY:
+        if self.which_asset(tr) is tr.buy:
             if tr.buy.cost is None:
                 value, fixed = self.value_asset.get_value(tr.buy.asset,
                                                           tr.buy.timestamp,
                                                           tr.buy.quantity)
             else:
                 value, fixed = tr.buy.cost, tr.buy.cost_fixed
-        elif config.trade_asset_type == config.TRADE_ASSET_TYPE_SELL:
+        else:
             if tr.sell.proceeds is None:
                 value, fixed = self.value_asset.get_value(tr.sell.asset,
                                                           tr.sell.timestamp,
                                                           tr.sell.quantity)
             else:
                 value, fixed = tr.sell.proceeds, tr.sell.proceeds_fixed
-        else:
-            pos_sell_asset = pos_buy_asset = len(config.asset_priority) + 1
-
-            if tr.sell.asset in config.asset_priority:
-                pos_sell_asset = config.asset_priority.index(tr.sell.asset)
-            if tr.buy.asset in config.asset_priority:
-                pos_buy_asset = config.asset_priority.index(tr.buy.asset)
-
-            if pos_sell_asset <= pos_buy_asset:
-                if tr.sell.proceeds is None:
-                    value, fixed = self.value_asset.get_value(tr.sell.asset,
-                                                              tr.sell.timestamp,
-                                                              tr.sell.quantity)
-                else:
-                    value, fixed = tr.sell.proceeds, tr.sell.proceeds_fixed
-            else:
-                if tr.buy.cost is None:
-                    value, fixed = self.value_asset.get_value(tr.buy.asset,
-                                                              tr.buy.timestamp,
-                                                              tr.buy.quantity)
-                else:
-                    value, fixed = tr.buy.cost, tr.buy.cost_fixed
 
         return value, fixed
 
+    @staticmethod
+    def which_asset(tr):
+        # The buy or the sell, whichever is used to value a trade
+        if config.trade_asset_type == config.TRADE_ASSET_TYPE_BUY:
+            return tr.buy
+        if config.trade_asset_type == config.TRADE_ASSET_TYPE_SELL:
+            return tr.sell
+
+        pos_sell_asset = pos_buy_asset = len(config.asset_priority) + 1
+
+        if tr.sell.asset in config.asset_priority:
+            pos_sell_asset = config.asset_priority.index(tr.sell.asset)
+        if tr.buy.asset in config.asset_priority:
+            pos_buy_asset = config.asset_priority.index(tr.buy.asset)
+
+        if pos_sell_asset <= pos_buy_asset:
+            return tr.sell
+        return tr.buy
+
+    @staticmethod
+    def price_lookups(transaction_records):
+        # Assets and timestamps which get_all_values will need a price for, so the prices can
+        #  be fetched before the records are valued. It doesn't need to be exact, any missed
+        #  are fetched when they are valued
+        lookups = set()
+
+        for tr in transaction_records:
+            if tr.buy and tr.buy.acquisition and tr.buy.cost is None:
+                if tr.sell:
+                    t = TransactionHistory.which_asset(tr)
+                    if t is tr.buy or tr.sell.proceeds is None:
+                        lookups.add((t.asset, t.timestamp, t.quantity))
+                else:
+                    lookups.add((tr.buy.asset, tr.buy.timestamp, tr.buy.quantity))
+
+            if tr.sell and tr.sell.disposal and tr.sell.proceeds is None and not tr.buy:
+                lookups.add((tr.sell.asset, tr.sell.timestamp, tr.sell.quantity))
+
+            if tr.fee and tr.fee.disposal and tr.fee.proceeds is None:
+                # Unless the fee can be valued at the same price as the buy or sell
+                if tr.fee.asset in config.fiat_list or \
+                        not (tr.buy and tr.buy.asset == tr.fee.asset and tr.buy.acquisition or
+                             tr.sell and tr.sell.asset == tr.fee.asset and tr.sell.disposal):
+                    lookups.add((tr.fee.asset, tr.fee.timestamp, tr.fee.quantity))
+
+        return {(asset, timestamp) for asset, timestamp, quantity in lookups
+                if asset != config.ccy and quantity}
+
 class TransactionBase(object):
+    # Held for every transaction, so no per-instance dict
+    __slots__ = ('tid', 't_record', 't_type', 'asset', 'quantity', 'fee_value', 'fee_fixed',
+                 'wallet', 'timestamp', 'day', 'note', 'matched', 'pooled')
+
     def __init__(self, t_type, asset, quantity):
         self.tid = None
         self.t_record = None
@@ -190,6 +228,7 @@ class TransactionBase(object):
         self.fee_fixed = True
         self.wallet = None
         self.timestamp = None
+        self.day = None
         self.note = None
         self.matched = False
         self.pooled = []
@@ -253,16 +292,19 @@ class TransactionBase(object):
     def __lt__(self, other):
         return (self.asset, self.timestamp) < (other.asset, other.timestamp)
 
-    def __deepcopy__(self, memo):
+    def __copy__(self):
         cls = self.__class__
         result = cls.__new__(cls)
-        memo[id(self)] = result
-        for k, v in self.__dict__.items():
-            if k == 't_record':
-                # Keep reference to the transaction record
-                setattr(result, k, v)
-            else:
-                setattr(result, k, copy.deepcopy(v, memo))
+        # Values are immutable (Decimal, datetime, str) so can be shared with the original,
+        #  this includes the reference to the transaction record
+        (result.tid, result.t_record, result.t_type, result.asset, result.quantity,
+         result.fee_value, result.fee_fixed, result.wallet, result.timestamp, result.day,
+         result.note, result.matched) = (self.tid, self.t_record, self.t_type, self.asset,
+                                         self.quantity, self.fee_value, self.fee_fixed,
+                                         self.wallet, self.timestamp, self.day, self.note,
+                                         self.matched)
+        # Only the pooled list is modified in place, so it can't be shared
+        result.pooled = list(self.pooled)
         return result
 
 class Buy(TransactionBase):
@@ -279,6 +321,10 @@ class Buy(TransactionBase):
     ACQUISITION_TYPES = {TYPE_MINING, TYPE_STAKING, TYPE_INTEREST, TYPE_DIVIDEND,
                          TYPE_INCOME, TYPE_GIFT_RECEIVED, TYPE_AIRDROP, TYPE_TRADE}
 
+    INCOME_TYPES = (TYPE_MINING, TYPE_STAKING, TYPE_DIVIDEND, TYPE_INTEREST, TYPE_INCOME)
+
+    __slots__ = ('acquisition', 'cost', 'cost_fixed')
+
     def __init__(self, t_type, buy_quantity, buy_asset, buy_value):
         super(Buy, self).__init__(t_type, buy_asset, buy_quantity)
         self.acquisition = bool(self.t_type in self.ACQUISITION_TYPES)
@@ -289,9 +335,15 @@ class Buy(TransactionBase):
             self.cost = buy_value
             self.cost_fixed = True
 
+    def __copy__(self):
+        result = super(Buy, self).__copy__()
+        result.acquisition, result.cost, result.cost_fixed = \
+                self.acquisition, self.cost, self.cost_fixed
+        return result
+
     def __iadd__(self, other):
         if not self.pooled:
-            self.pooled.append(copy.deepcopy(self))
+            self.pooled.append(copy.copy(self))
 
         # Pool buys
         if self.asset != other.asset:
@@ -307,6 +359,7 @@ class Buy(TransactionBase):
         if other.timestamp < self.timestamp:
             # Keep timestamp of earliest transaction
             self.timestamp = other.timestamp
+            self.day = other.day
 
         if other.wallet != self.wallet:
             self.wallet = "<pooled>"
@@ -324,12 +377,13 @@ class Buy(TransactionBase):
         return self
 
     def split_buy(self, sell_quantity):
-        remainder = copy.deepcopy(self)
+        remainder = copy.copy(self)
+        proportion = sell_quantity / self.quantity
 
-        self.cost = self.cost * (sell_quantity / self.quantity)
+        self.cost = self.cost * proportion
 
         if self.fee_value:
-            self.fee_value = self.fee_value * (sell_quantity / self.quantity)
+            self.fee_value = self.fee_value * proportion
 
         self.quantity = sell_quantity
         self.set_tid()
@@ -380,6 +434,8 @@ class Sell(TransactionBase):
     DISPOSAL_TYPES = {TYPE_SPEND, TYPE_GIFT_SENT, TYPE_GIFT_SPOUSE, TYPE_CHARITY_SENT,
                       TYPE_LOST, TYPE_TRADE}
 
+    __slots__ = ('disposal', 'proceeds', 'proceeds_fixed')
+
     def __init__(self, t_type, sell_quantity, sell_asset, sell_value):
         super(Sell, self).__init__(t_type, sell_asset, sell_quantity)
         self.disposal = bool(self.t_type in self.DISPOSAL_TYPES)
@@ -390,9 +446,15 @@ class Sell(TransactionBase):
             self.proceeds = sell_value
             self.proceeds_fixed = True
 
+    def __copy__(self):
+        result = super(Sell, self).__copy__()
+        result.disposal, result.proceeds, result.proceeds_fixed = \
+                self.disposal, self.proceeds, self.proceeds_fixed
+        return result
+
     def __iadd__(self, other):
         if not self.pooled:
-            self.pooled.append(copy.deepcopy(self))
+            self.pooled.append(copy.copy(self))
 
         # Pool sells
         if self.asset != other.asset:
@@ -408,6 +470,7 @@ class Sell(TransactionBase):
         if other.timestamp > self.timestamp:
             # Keep timestamp of latest transaction
             self.timestamp = other.timestamp
+            self.day = other.day
 
         if other.wallet != self.wallet:
             self.wallet = "<pooled>"
@@ -425,12 +488,13 @@ class Sell(TransactionBase):
         return self
 
     def split_sell(self, buy_quantity):
-        remainder = copy.deepcopy(self)
+        remainder = copy.copy(self)
+        proportion = buy_quantity / self.quantity
 
-        self.proceeds = self.proceeds * (buy_quantity / self.quantity)
+        self.proceeds = self.proceeds * proportion
 
         if self.fee_value:
-            self.fee_value = self.fee_value * (buy_quantity / self.quantity)
+            self.fee_value = self.fee_value * proportion
 
         self.quantity = buy_quantity
         self.set_tid()
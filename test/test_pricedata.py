@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# (c) Nano Nano Ltd 2021
+
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import requests
+
+from bittytax.config import config
+from bittytax.price.datasource import DataSourceBase
+from bittytax.price.valueasset import ValueAsset
+
+class StubSource(DataSourceBase):
+    # Counts the requests made, instead of using the network. BTC has a price for every day,
+    #  NODATA returns nothing and DOWN fails
+    def __init__(self):
+        super(StubSource, self).__init__()
+        self.assets = {asset: {'name': asset} for asset in ('BTC', 'NODATA', 'DOWN')}
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def get_historical(self, asset, quote, timestamp, _asset_id=None):
+        with self.lock:
+            self.requests[(self.pair(asset, quote), timestamp.strftime('%Y-%m-%d'))] += 1
+
+        if asset == 'DOWN':
+            raise requests.exceptions.ConnectionError('stub connection error')
+
+        if asset == 'BTC':
+            self.prices.update(self.pair(asset, quote),
+                               {(timestamp + timedelta(days=d)).strftime('%Y-%m-%d'): {
+                                   'price': Decimal(30000 + d), 'url': None} for d in range(3)})
+
+class TestPriceData(unittest.TestCase):
+    def setUp(self):
+        self.saved_config = dict(config.config)
+        self.saved_cache_dir = config.CACHE_DIR
+        config.CACHE_DIR = tempfile.mkdtemp()
+        config.config['data_source_fiat'] = ['StubSource']
+        config.config['data_source_crypto'] = ['StubSource']
+        config.config['data_source_select'] = {}
+
+    def tearDown(self):
+        shutil.rmtree(config.CACHE_DIR)
+        config.CACHE_DIR = self.saved_cache_dir
+        config.config = self.saved_config
+
+    def test_each_date_requested_once(self):
+        value_asset = ValueAsset()
+        data_source = value_asset.price_data.data_sources['STUBSOURCE']
+
+        start = datetime(2020, 1, 1, 12, tzinfo=config.TZ_UTC)
+        lookups = {(asset, start + timedelta(days=d))
+                   for asset in ('BTC', 'NODATA', 'DOWN') for d in range(10)}
+
+        value_asset.prefetch_historical_prices(lookups)
+        for asset, timestamp in sorted(lookups):
+            value_asset.get_value(asset, timestamp, Decimal(1))
+
+        self.assertEqual(max(data_source.requests.values()), 1)
+        self.assertEqual({pair for pair, _ in data_source.requests},
+                         {'BTC/GBP', 'NODATA/BTC', 'DOWN/BTC'})
+        # NODATA and DOWN are asked for every date, BTC returns 3 days with each request
+        self.assertEqual(len([1 for pair, _ in data_source.requests if pair == 'BTC/GBP']), 4)
+        self.assertEqual(len([1 for pair, _ in data_source.requests if pair == 'DOWN/BTC']), 10)
+
+if __name__ == '__main__':
+    unittest.main()